@@ -1,40 +1,38 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { Activity, Brain, Zap, Clock } from 'lucide-react';
 
 const SpyWindow = () => {
     const [metrics, setMetrics] = useState(null);
     const [history, setHistory] = useState([]);
-    const [lastStep, setLastStep] = useState(-1);
+    const lastStep = useRef(-1);
 
     useEffect(() => {
-        const fetchMetrics = async () => {
-            try {
-                const response = await fetch('/spy_metrics.json?t=' + Date.now());
-                if (response.ok) {
-                    const data = await response.json();
-                    setMetrics(data);
+        // Training metrics are pushed by the ML backend (Server-Sent Events, in-memory ring)
+        const mlBackend = import.meta.env.VITE_ML_BACKEND_URL || "http://localhost:9090";
+        const source = new EventSource(`${mlBackend}/spy/stream`);
 
-                    if (data.train_step > lastStep) {
-                        setLastStep(data.train_step);
-                        setHistory(prev => {
-                            const newHistory = [...prev, {
-                                step: data.train_step,
-                                alpha: data.current_alpha,
-                                beta: data.current_beta
-                            }];
-                            return newHistory.slice(-20);
-                        });
-                    }
-                }
-            } catch (error) {
-                console.error("Waiting for metrics...", error);
+        source.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            setMetrics(data);
+
+            if (data.train_step > lastStep.current) {
+                lastStep.current = data.train_step;
+                setHistory(prev => {
+                    const newHistory = [...prev, {
+                        step: data.train_step,
+                        alpha: data.current_alpha,
+                        beta: data.current_beta
+                    }];
+                    return newHistory.slice(-20);
+                });
             }
         };
+        // EventSource reconnects on its own (resuming from Last-Event-ID)
+        source.onerror = (error) => console.error("Waiting for metrics...", error);
 
-        const interval = setInterval(fetchMetrics, 1000);
-        return () => clearInterval(interval);
-    }, [lastStep]);
+        return () => source.close();
+    }, []);
 
     if (!metrics) return (
         <div className="min-h-screen bg-gray-900 text-white flex items-center justify-center p-10 text-center">
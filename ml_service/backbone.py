@@ -3,44 +3,177 @@ Real ML Backbone: Sentence-Transformers + Sklearn SGDClassifier
 Provides real probability predictions for CAL-Log entropy calculation.
 NO GPU required - runs efficiently on CPU.
 """
+import os
+import copy
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from scipy.special import expit
 from sklearn.linear_model import SGDClassifier
 from sklearn.preprocessing import LabelEncoder
 from sklearn.calibration import CalibratedClassifierCV
 import warnings
 import joblib
 
+from embedding_cache import EmbeddingCache
+from feature_store import FeatureStore
+from embedders import load_embedder
+from encoding_pipeline import EncodingPipeline
+from embedding_pool import EmbeddingPool
+from metrics import timer, observe_batch
+from request_coalescer import RequestCoalescer
+from replay_buffer import ReplayBuffer
+
 warnings.filterwarnings("ignore")
 
 
+class LinearHead:
+    """
+    Fast path for the SGD log-loss head: probabilities via one float32 GEMM.
+    Weights are exported once per model version, already laid out in full num_labels order,
+    so re-scoring cached embeddings never touches sklearn or the transformer.
+    Matches SGDClassifier.predict_proba (one-vs-rest sigmoids, normalized per row).
+    """
+    
+    def __init__(self, classifier, num_labels):
+        classes = np.asarray(classifier.classes_, dtype=int)
+        coef = np.asarray(classifier.coef_, dtype=np.float32)
+        intercept = np.asarray(classifier.intercept_, dtype=np.float32)
+        self.num_labels = num_labels
+        self.binary = coef.shape[0] == 1
+        
+        if self.binary:
+            # Binary heads have a single weight vector for classes_[1]
+            self.W = np.ascontiguousarray(coef.T)
+            self.b = intercept
+            self.neg, self.pos = int(classes[0]), int(classes[1])
+        else:
+            self.W = np.zeros((coef.shape[1], num_labels), dtype=np.float32)
+            self.b = np.zeros(num_labels, dtype=np.float32)
+            self.W[:, classes] = coef.T
+            self.b[classes] = intercept
+            self.active = np.zeros(num_labels, dtype=bool)
+            self.active[classes] = True
+    
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        p = expit(X @ self.W + self.b)
+        if self.binary:
+            proba = np.zeros((len(X), self.num_labels), dtype=np.float32)
+            proba[:, self.neg] = 1.0 - p[:, 0]
+            proba[:, self.pos] = p[:, 0]
+            return proba
+        p[:, ~self.active] = 0.0
+        total = p.sum(axis=1, keepdims=True)
+        # All sigmoids underflowed: uniform over trained classes, like sklearn
+        empty = total[:, 0] == 0
+        if np.any(empty):
+            p[np.ix_(empty, self.active)] = 1.0
+            total[empty] = self.active.sum()
+        return p / total
+
+
 class StandardBackbone:
     """
     Production-ready ML backbone using:
-    - Sentence-Transformers for text embeddings (fast, pre-trained)
+    - Sentence-Transformers for text embeddings (fast, pre-trained),
+      served by a selectable engine: torch, onnx or onnx-int8
     - SGDClassifier for incremental learning (supports partial_fit)
     - Calibrated probabilities for accurate entropy calculation
+    - Content-addressed embedding cache (memory LRU + memory-mapped disk)
+    - Per-text feature store (word count, log length, token count)
+    - Length-bucketed, micro-batched encoding streamed in bounded chunks
+    - Optional multi-process embedding pool for large batches
     """
     
-    def __init__(self, model_name="all-MiniLM-L6-v2", num_labels=4, problem_type="single_label_classification"):
+    def __init__(self, model_name="all-MiniLM-L6-v2", num_labels=4, problem_type="single_label_classification",
+                 cache_dir=None, cache_size=50000, engine=None, batch_size=None, chunk_size=None,
+                 pool_workers=None, pool_threshold=None, embed_socket=None):
         self.model_name = model_name
         self.num_labels = num_labels
         self.problem_type = problem_type
+        self.engine = engine or os.environ.get("EMBEDDER_ENGINE", "torch")
+        
+        # Sentence Transformer for embeddings: shared sidecar if configured, else in-process
+        if embed_socket is None:
+            embed_socket = os.environ.get("EMBED_SERVER_SOCKET", "")
+        self.embedder = self._connect_embedder(embed_socket) if embed_socket else None
+        self.remote = self.embedder is not None
+        if self.remote:
+            self.engine = self.embedder.engine
+            if self.embedder.model_name != model_name:
+                print(f"⚠️ Embedding server runs {self.embedder.model_name}, not {model_name}. Using the server's model.")
+                self.model_name = model_name = self.embedder.model_name
+        else:
+            print(f"⚡ Loading Sentence-Transformer: {model_name} (engine={self.engine})...")
+            self.embedder = load_embedder(self.engine, model_name)
+        self.embedding_dim = self.embedder.get_sentence_embedding_dimension()
+        print(f"✅ Embedder loaded (dim={self.embedding_dim})")
+        
+        # Process pool for large batches (0 workers = disabled; started on first use)
+        if pool_workers is None:
+            pool_workers = int(os.environ.get("EMBED_POOL_WORKERS", 0))
+        if pool_threshold is None:
+            pool_threshold = int(os.environ.get("EMBED_POOL_THRESHOLD", 2048))
+        self.pool_workers = pool_workers
+        self.pool_threshold = pool_threshold
+        self._pool = None
         
-        # Sentence Transformer for embeddings
-        print(f"⚡ Loading Sentence-Transformer: {model_name}...")
-        self.embedder = SentenceTransformer(model_name)
-        print(f"✅ Embedder loaded (dim={self.embedder.get_sentence_embedding_dimension()})")
+        # Embedding cache (set EMBEDDING_CACHE_DIR="" to keep it memory-only)
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                "EMBEDDING_CACHE_DIR",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache")
+            )
+        # Engines produce slightly different vectors, so they get separate cache namespaces
+        cache_namespace = model_name if self.engine == "torch" else f"{model_name}@{self.engine}"
+        self.cache = EmbeddingCache(cache_namespace, self.embedding_dim, cache_dir=cache_dir or None,
+                                    max_memory_items=cache_size,
+                                    max_disk_items=int(os.environ.get("EMBEDDING_CACHE_DISK_ITEMS", 500000)))
+        
+        # Text features (word count, log length, token count), computed once per text
+        self.features = FeatureStore(self.embedder.token_lengths, model_name, cache_dir=cache_dir or None,
+                                     max_disk_items=int(os.environ.get("FEATURE_CACHE_DISK_ITEMS", 2000000)))
+        
+        # Encoding pipeline: sort by token length, encode in micro-batches, stream per chunk
+        self.pipeline = EncodingPipeline(
+            self.embedder.encode,
+            self.features.token_counts,  # token counts come from the feature store
+            self.embedding_dim,
+            batch_size=batch_size or int(os.environ.get("EMBED_BATCH_SIZE", 64)),
+            chunk_size=chunk_size or int(os.environ.get("EMBED_CHUNK_SIZE", 4096)),
+        )
+        
+        # Dynamic batching: concurrent small requests share one transformer pass
+        # (EMBED_COALESCE_MS=0 disables; requests of max_batch texts or more go straight through)
+        self.coalescer = RequestCoalescer(
+            self._encode_batch,
+            max_batch=int(os.environ.get("EMBED_COALESCE_MAX", 4 * self.pipeline.batch_size)),
+            max_wait=float(os.environ.get("EMBED_COALESCE_MS", 5)) / 1000.0,
+            latency_budget=float(os.environ.get("EMBED_LATENCY_BUDGET_MS", 250)) / 1000.0,
+            name="encode_coalesced",
+        )
         
         # Sklearn classifier (supports incremental learning)
         self.classifier = None
+        self._head = None  # LinearHead, rebuilt lazily after every classifier update
+        self.model_version = 0
         self.label_encoder = LabelEncoder()
         self.is_fitted = False
         self.classes_ = list(range(num_labels))
         
-    def initialize_model(self):
-        """Initialize a fresh classifier."""
-        self.classifier = SGDClassifier(
+        # Earlier annotations as float16 embeddings, mixed into every partial_fit
+        self.replay = ReplayBuffer(
+            self.embedding_dim,
+            capacity=int(os.environ.get("REPLAY_BUFFER_SIZE", 10000)),
+            max_bytes=float(os.environ.get("REPLAY_BUFFER_MB", 32)) * 2 ** 20,
+            strategy=os.environ.get("REPLAY_STRATEGY", "balanced"),
+        )
+        self.replay_ratio = float(os.environ.get("REPLAY_RATIO", 4))  # replayed rows per new row
+        self.replay_min = int(os.environ.get("REPLAY_MIN_SAMPLES", 32))
+        self.rebuild_epochs = int(os.environ.get("REPLAY_REBUILD_EPOCHS", 3))
+        
+    @staticmethod
+    def _new_classifier():
+        return SGDClassifier(
             loss='log_loss',  # Logistic regression for probabilities
             penalty='l2',
             alpha=0.0001,
@@ -50,18 +183,84 @@ class StandardBackbone:
             warm_start=True,  # Enable incremental learning
             n_jobs=-1
         )
+    
+    def initialize_model(self):
+        """Initialize a fresh classifier."""
+        self.classifier = self._new_classifier()
+        self._head = None
         self.is_fitted = False
         print("✅ Classifier initialized (SGDClassifier with log_loss)")
     
+    @staticmethod
+    def _connect_embedder(socket_path):
+        """Client for the shared embedding server, or None if it is not reachable."""
+        from embedding_server import EmbeddingClient
+        try:
+            client = EmbeddingClient(socket_path)
+            print(f"🔌 Using shared embedding server at {socket_path} (engine={client.engine})")
+            return client
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️ Embedding server at {socket_path} unavailable ({e}). Loading the model in-process.")
+            return None
+    
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = EmbeddingPool(
+                self.engine, self.model_name, self.pool_workers,
+                batch_size=self.pipeline.batch_size, max_shard_size=self.pipeline.chunk_size
+            )
+        return self._pool
+    
+    def _encode(self, texts):
+        """Run the transformer on texts (no caching); small concurrent calls share one pass."""
+        return self.coalescer(texts)
+    
+    def _encode_batch(self, texts):
+        """Run the transformer on texts (no caching), length-bucketed and micro-batched."""
+        # Concurrent requests often carry the same tasks (prefetch, refresh): encode each text once
+        unique = list(dict.fromkeys(texts))
+        if len(unique) < len(texts):
+            rows = {text: i for i, text in enumerate(unique)}
+            return self._encode_batch(unique)[[rows[t] for t in texts]]
+        observe_batch("encode", len(texts))
+        with timer("encode"):
+            if self.remote:
+                # One round trip per chunk; the server does the bucketing and batching
+                return self.embedder.encode(texts)
+            if self.pool_workers > 1 and len(texts) >= self.pool_threshold:
+                return self._get_pool().encode(texts)
+            return self.pipeline.encode(texts)
+    
     def embed(self, texts):
         """
         Convert texts to dense embeddings using sentence-transformers.
+        Texts already seen by this model are served from the embedding cache.
         Returns: np.ndarray of shape (n_texts, embedding_dim)
         """
         if isinstance(texts, str):
             texts = [texts]
-        embeddings = self.embedder.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-        return embeddings
+        observe_batch("embed", len(texts))
+        with timer("embed"):
+            return self.cache.embed(list(texts), self._encode)
+    
+    def iter_embeddings(self, texts):
+        """
+        Stream embeddings chunk by chunk (cache-aware).
+        Yields: (start_index, np.ndarray of shape (chunk_len, embedding_dim))
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        chunk = self.pipeline.chunk_size
+        if self.pool_workers > 1:
+            # Give every pool worker a full chunk per pass
+            chunk *= self.pool_workers
+        for start in range(0, len(texts), chunk):
+            yield start, self.embed(texts[start:start + chunk])
+    
+    def cache_stats(self):
+        """Hit/miss counters of the embedding cache."""
+        return self.cache.stats()
     
     def fine_tune(self, texts, labels, epochs=3, logger_func=None):
         """
@@ -86,6 +285,8 @@ class StandardBackbone:
         if isinstance(labels[0], str):
             self.label_encoder.fit(labels)
             labels = self.label_encoder.transform(labels)
+            # Buffered rows carry the previous encoding's indices
+            self.replay.clear()
         
         # Get embeddings
         X = self.embed(texts)
@@ -109,7 +310,9 @@ class StandardBackbone:
             # Partial fit (incremental update)
             self.classifier.partial_fit(X_shuffled, y_shuffled, classes=self.classes_)
         
-        self.is_fitted = True
+        self._mark_updated()
+        # Seed the replay buffer, so a later head rebuild keeps what was learned here
+        self.replay.add(X, y)
         
         # Calculate training accuracy
         predictions = self.classifier.predict(X)
@@ -127,41 +330,106 @@ class StandardBackbone:
             "epochs": epochs
         }
     
+    def _encode_labels(self, labels):
+        """
+        String labels -> class indices, growing the encoding for labels not seen before.
+        Nothing is changed here; partial_fit applies the new encoder once the head is trained.
+        
+        Returns: (indices, encoder, mapping) where `mapping` ({old index: new index}) is set
+        when existing indices moved (the encoder keeps classes sorted), so the current head
+        and the replay buffer no longer match them.
+        """
+        known = self.label_encoder.classes_.tolist() if hasattr(self.label_encoder, 'classes_') else []
+        unseen = sorted(set(labels) - set(known))
+        encoder, mapping = self.label_encoder, None
+        if unseen:
+            encoder = LabelEncoder().fit(known + unseen)
+            if known:
+                print(f"🆕 New label(s) {unseen}: extending the label encoding")
+                moved = dict(enumerate(encoder.transform(known).tolist()))
+                if any(old != new for old, new in moved.items()):
+                    mapping = moved
+        return encoder.transform(labels), encoder, mapping
+    
     def partial_fit(self, texts, labels):
         """
         Incremental training on new batch of data.
         Useful for online learning as user annotates.
+        
+        Each batch is mixed with a sample of earlier annotations from the replay buffer
+        (no transformer calls), so the head does not drift toward the latest labels.
+        A label the head was not built for re-trains a fresh head on the buffer instead.
+        The label encoding and the buffer only change once the new head is trained.
         """
         if len(texts) < 1:
             return {"status": "error", "message": "No data provided"}
         
         print(f"🔄 Incremental training on {len(texts)} new samples...")
         
+        observe_batch("partial_fit", len(texts))
+        X = self.embed(texts)
+        
         # Convert labels if string
+        encoder, mapping = None, None
         if isinstance(labels[0], str):
-            # Use existing encoder or fit new one
-            if not hasattr(self.label_encoder, 'classes_') or len(self.label_encoder.classes_) == 0:
-                self.label_encoder.fit(labels)
-            labels = self.label_encoder.transform(labels)
-        
-        X = self.embed(texts)
-        y = np.array(labels)
+            y, encoder, mapping = self._encode_labels(labels)
+        else:
+            y = np.asarray(labels)
+        rebuild = mapping is not None
         
         # Initialize if first call
         if self.classifier is None:
             self.initialize_model()
         
-        # Update classes if new labels appear
-        new_classes = list(set(self.classes_) | set(y.tolist()))
-        self.classes_ = sorted(new_classes)
+        # Every class of the encoding (or seen so far), not just this batch's:
+        # a remap can move an old class to an index only the replayed rows carry
+        if encoder is not None:
+            classes = list(range(len(encoder.classes_)))
+        else:
+            classes = sorted(set(self.classes_) | set(y.tolist()))
+        # SGDClassifier fixes its classes on the first partial_fit
+        trained = getattr(self.classifier, 'classes_', None)
+        if trained is not None and set(classes) != set(trained.tolist()):
+            rebuild = True
         
-        # Incremental update
-        self.classifier.partial_fit(X, y, classes=self.classes_)
-        self.is_fitted = True
+        # Replay rows are drawn before this batch joins the buffer
+        if rebuild:
+            X_old, y_old = self.replay.all()
+            if mapping is not None:
+                lookup = np.asarray([mapping[i] for i in range(len(mapping))], dtype=np.int64)
+                y_old = lookup[y_old]
+        else:
+            X_old, y_old = self.replay.sample(max(self.replay_min, int(self.replay_ratio * len(texts))))
+        X_train = np.vstack([X, X_old]) if len(X_old) else X
+        y_train = np.concatenate([y, y_old]) if len(y_old) else y
+        num_labels = max(self.num_labels, len(classes), int(y_train.max()) + 1)
+        
+        # Incremental update on a copy, swapped in whole: concurrent predict() calls
+        # see either the previous or the new weights, never a half-applied update
+        with timer("partial_fit"):
+            if rebuild:
+                print(f"🔁 Re-training the head on {len(X)} new + {len(X_old)} replayed samples ({len(classes)} classes)")
+                classifier = self._new_classifier()
+                for _ in range(self.rebuild_epochs):
+                    order = np.random.permutation(len(X_train))
+                    classifier.partial_fit(X_train[order], y_train[order], classes=classes)
+            else:
+                classifier = copy.deepcopy(self.classifier)
+                classifier.partial_fit(X_train, y_train, classes=classes)
+            
+            # The head trained: commit the encoding, then the buffer, then the weights
+            if encoder is not None:
+                self.label_encoder = encoder
+            if mapping is not None:
+                self.replay.remap(mapping)
+            self.replay.add(X, y)
+            self.num_labels = num_labels
+            self.classes_ = classes
+            self._publish(classifier)
         
         print(f"✅ Incremental training complete")
         
-        return {"status": "success", "num_samples": len(texts)}
+        return {"status": "success", "num_samples": len(texts), "replayed": len(X_old), "rebuilt": rebuild}
     
     def predict_proba(self, texts):
         """
@@ -177,27 +445,74 @@ class StandardBackbone:
             n_texts = len(texts) if isinstance(texts, list) else 1
             return np.ones((n_texts, self.num_labels)) / self.num_labels
         
-        X = self.embed(texts)
+        if isinstance(texts, str):
+            texts = [texts]
         
         try:
-            # Get calibrated probabilities
-            proba = self.classifier.predict_proba(X)
-            
-            # Ensure correct shape (pad with zeros if fewer classes trained)
-            if proba.shape[1] < self.num_labels:
-                padded = np.zeros((proba.shape[0], self.num_labels))
-                for i, cls in enumerate(self.classifier.classes_):
-                    padded[:, cls] = proba[:, i]
-                proba = padded
-                # Normalize
-                proba = proba / proba.sum(axis=1, keepdims=True)
-            
+            # Classify chunk by chunk so large pools never hold all embeddings at once
+            proba = np.empty((len(texts), self.num_labels))
+            for start, X in self.iter_embeddings(texts):
+                with timer("classify"):
+                    proba[start:start + len(X)] = self._classify(X)
             return proba
             
         except Exception as e:
             print(f"⚠️ Prediction error: {e}. Returning uniform.")
             return np.ones((len(texts), self.num_labels)) / self.num_labels
     
+    def classify_embeddings(self, X):
+        """
+        Probabilities for already-embedded texts (e.g. rows of the pool store).
+        Never touches the transformer.
+        
+        Returns:
+            np.ndarray of shape (n, num_labels)
+        """
+        if not self.is_fitted or self.classifier is None:
+            return np.ones((len(X), self.num_labels)) / self.num_labels
+        return self._classify(X)
+    
+    def _mark_updated(self):
+        """Classifier weights changed: bump the version and drop the exported head."""
+        self.is_fitted = True
+        self.model_version += 1
+        self._head = None
+    
+    def _publish(self, classifier):
+        """Atomically replace the classifier (and its exported head) with a trained one."""
+        head = LinearHead(classifier, self.num_labels) if max(classifier.classes_) < self.num_labels else None
+        self.classifier = classifier
+        self._head = head
+        self.is_fitted = True
+        self.model_version += 1
+    
+    def export_head(self):
+        """Current classifier as a LinearHead (cached until the next update)."""
+        if self._head is None:
+            self._head = LinearHead(self.classifier, self.num_labels)
+        return self._head
+    
+    def _classify(self, X):
+        """Classifier probabilities for embeddings X, laid out as (n, num_labels)."""
+        classifier = self.classifier  # one reference: the trainer may swap in a new one
+        if max(classifier.classes_) < self.num_labels:
+            # One GEMM + sigmoid normalization, no sklearn overhead
+            return self.export_head().predict_proba(X)
+        
+        # Get calibrated probabilities
+        proba = classifier.predict_proba(X)
+        
+        # Ensure correct shape (pad with zeros if fewer classes trained)
+        if proba.shape[1] < self.num_labels:
+            padded = np.zeros((proba.shape[0], self.num_labels))
+            for i, cls in enumerate(classifier.classes_):
+                padded[:, cls] = proba[:, i]
+            proba = padded
+            # Normalize
+            proba = proba / proba.sum(axis=1, keepdims=True)
+        
+        return proba
+    
     def predict(self, texts):
         """
         Predict class labels for texts.
@@ -215,11 +530,16 @@ class StandardBackbone:
             print("⚠️ Model not fitted, nothing to save.")
             return
         
+        # Write aside and rename, so a crash mid-dump never leaves a truncated model
+        tmp_path = path + ".tmp"
         joblib.dump({
             'classifier': self.classifier, 
             'encoder': self.label_encoder, 
-            'classes': self.classes_
-        }, path)
+            'classes': self.classes_,
+            'num_labels': self.num_labels,
+            'replay': self.replay.state_dict(),
+        }, tmp_path)
+        os.replace(tmp_path, path)
         print(f"💾 Model saved to {path}")
 
     def load_model(self, path):
@@ -229,7 +549,13 @@ class StandardBackbone:
             self.classifier = data['classifier']
             self.label_encoder = data['encoder']
             self.classes_ = data['classes']
-            self.is_fitted = True
+            self.num_labels = data.get('num_labels', self.num_labels)
+            if 'replay' in data:
+                try:
+                    self.replay.load_state_dict(data['replay'])
+                except ValueError as e:
+                    print(f"⚠️ Replay buffer not restored: {e}")
+            self._mark_updated()
             print(f"✅ Model loaded successfully from {path}")
         except Exception as e:
             print(f"❌ Failed to load model: {e}")
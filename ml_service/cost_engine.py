@@ -1,35 +1,123 @@
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+from metrics import timer
 
 class AdaptiveCostModel:
-    def __init__(self):
+    WINDOW_SIZE = 50
+
+    def __init__(self, window_size: int = WINDOW_SIZE, decay: float = None):
         # Default parameters from your paper (Cold Start)
         self.alpha = 5.0  # Overhead
         self.beta = 3.0   # Reading Speed
-        self.user_history = [] # Stores (log_length, time_taken)
 
-    def _heuristic_cost(self, log_length: float) -> float:
+        # Fixed-size ring buffer of (log_length, time_taken) + running sums for O(1) refits.
+        # decay=None: exact sliding window; 0 < decay < 1: exponentially weighted history
+        self.window_size = window_size
+        self.decay = decay
+        self._buffer = np.zeros((window_size, 2))
+        self._head = 0
+        self._count = 0
+        self._since_resync = 0
+        self._sums = np.zeros(5)  # [n, Σx, Σy, Σx², Σxy]
+
+    @property
+    def user_history(self) -> list:
+        """Window contents, oldest first (rows of [log_length, time_taken])."""
+        if self._count < self.window_size:
+            return self._buffer[:self._count].tolist()
+        return np.roll(self._buffer, -self._head, axis=0).tolist()
+
+    def _heuristic_cost(self, log_length):
         return self.alpha + (self.beta * log_length)
 
     def predict(self, text_lengths: list) -> np.ndarray:
-        log_lengths = np.log1p(text_lengths) 
-        predicted_costs = [self._heuristic_cost(l) for l in log_lengths]
-        return np.array(predicted_costs)
-
-    def update(self, new_interaction_logs: list):
-        for log in new_interaction_logs:
-            x_feat = np.log1p(log['length'])
-            y_target = log['time_ms'] / 1000.0
-            if y_target < 300: 
-                self.user_history.append([x_feat, y_target])
-
-        WINDOW_SIZE = 50
-        history_to_use = self.user_history[-WINDOW_SIZE:]
-
-        if len(history_to_use) >= 1:
-            data = np.array(history_to_use)
-            X = data[:, 0].reshape(-1, 1) 
-            Y = data[:, 1]                
-            reg = LinearRegression().fit(X, Y)
-            self.alpha = max(0.1, reg.intercept_)
-            self.beta = max(0.1, reg.coef_[0])
+        log_lengths = np.log1p(np.asarray(text_lengths, dtype=np.float64))
+        return self._heuristic_cost(log_lengths)
+
+    @staticmethod
+    def _terms(x: float, y: float) -> np.ndarray:
+        return np.array([1.0, x, y, x * x, x * y])
+
+    def _resync(self):
+        # Recompute the window sums from the buffer to cancel floating-point drift
+        data = self._buffer[:self._count]
+        x, y = data[:, 0], data[:, 1]
+        self._sums = np.array([len(data), x.sum(), y.sum(), (x * x).sum(), (x * y).sum()])
+        self._since_resync = 0
+
+    def _push(self, x: float, y: float):
+        terms = self._terms(x, y)
+        if self.decay is not None:
+            self._sums = self.decay * self._sums + terms
+        else:
+            if self._count == self.window_size:
+                old_x, old_y = self._buffer[self._head]
+                self._sums -= self._terms(old_x, old_y)
+            self._sums += terms
+        self._buffer[self._head] = (x, y)
+        self._head = (self._head + 1) % self.window_size
+        self._count = min(self._count + 1, self.window_size)
+
+        self._since_resync += 1
+        if self.decay is None and self._since_resync >= self.window_size:
+            self._resync()
+
+    def _refit(self):
+        # Closed-form least squares from sufficient statistics (same result as LinearRegression)
+        n, sx, sy, sxx, sxy = self._sums
+        var_x = sxx - sx * sx / n
+        cov_xy = sxy - sx * sy / n
+        slope = cov_xy / var_x if var_x > 1e-12 * max(1.0, sxx) else 0.0
+        intercept = (sy - slope * sx) / n
+        self.alpha = max(0.1, intercept)
+        self.beta = max(0.1, slope)
+
+    def update(self, new_interaction_logs: list) -> list:
+        accepted = []
+        with timer("cost_update"):
+            for log in new_interaction_logs:
+                x_feat = np.log1p(log['length'])
+                y_target = log['time_ms'] / 1000.0
+                if y_target < 300:
+                    self._push(float(x_feat), float(y_target))
+                    accepted.append((float(x_feat), float(y_target)))
+
+            if self._count >= 1:
+                self._refit()
+        # (log_length, seconds) points that entered the window, for the interaction log
+        return accepted
+
+    def replay(self, history: list):
+        """Rebuild the window from persisted (log_length, seconds) points, oldest first."""
+        for x_feat, y_target in history:
+            self._push(float(x_feat), float(y_target))
+        if self._count >= 1:
+            self._refit()
+
+
+def stack_cost_params(cost_models: dict, user_ids: list = None, default: tuple = (5.0, 3.0)):
+    """
+    Gather per-annotator parameters into arrays.
+    Users without a model get `default` (alpha, beta).
+    Returns: (user_ids, alphas, betas), alphas/betas of shape (n_users,)
+    """
+    if user_ids is None:
+        user_ids = list(cost_models.keys())
+    models = [cost_models.get(u) for u in user_ids]
+    alphas = np.array([m.alpha if m is not None else default[0] for m in models], dtype=np.float64)
+    betas = np.array([m.beta if m is not None else default[1] for m in models], dtype=np.float64)
+    return user_ids, alphas, betas
+
+
+def predict_cost_matrix(alphas: np.ndarray, betas: np.ndarray, text_lengths=None, log_lengths=None) -> np.ndarray:
+    """
+    Cost = Alpha + Beta * log(1 + Length) for every (annotator, task) pair in one broadcast.
+    Pass precomputed `log_lengths` (e.g. from the feature store) to skip the log1p.
+    Returns: np.ndarray of shape (n_users, n_tasks)
+    """
+    if log_lengths is None:
+        log_lengths = np.log1p(np.asarray(text_lengths, dtype=np.float64))
+    log_lengths = np.asarray(log_lengths, dtype=np.float64)
+    alphas = np.asarray(alphas, dtype=np.float64).reshape(-1, 1)
+    betas = np.asarray(betas, dtype=np.float64).reshape(-1, 1)
+    return alphas + betas * log_lengths[None, :]
@@ -0,0 +1,194 @@
+"""
+Embedder engines for StandardBackbone.
+All engines share one contract: encode(texts) -> L2-normalized float32 array (n_texts, dim),
+using the same mean pooling as sentence-transformers.
+
+Engines:
+- torch:     sentence-transformers on PyTorch (reference implementation)
+- onnx:      ONNX Runtime, fp32 graph
+- onnx-int8: ONNX Runtime, dynamically int8-quantized weights (smallest + fastest on CPU)
+"""
+import os
+import numpy as np
+
+ENGINES = ("torch", "onnx", "onnx-int8")
+
+ML_SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Browser copy of the embedder shipped with the React client
+CLIENT_ONNX_PATH = os.path.join(ML_SERVICE_DIR, "..", "client", "public", "sbert.onnx")
+DEFAULT_ONNX_DIR = os.path.join(ML_SERVICE_DIR, "onnx_models")
+
+
+def hub_name(model_name):
+    """Short sentence-transformers names live under the 'sentence-transformers/' org on the Hub."""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def mean_pool(token_embeddings, attention_mask):
+    """Attention-masked mean over the token axis (sentence-transformers pooling)."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+def token_lengths(tokenizer, texts, max_seq_length):
+    """
+    Token count per text (including special tokens, capped at max_seq_length).
+    Falls back to a whitespace estimate when no fast tokenizer is available.
+    """
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        enc = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_seq_length)
+        return [len(ids) for ids in enc["input_ids"]]
+    return [min(len(t.split()) + 2, max_seq_length) for t in texts]
+
+
+def l2_normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.clip(norms, 1e-12, None)
+
+
+class TorchEmbedder:
+    """PyTorch sentence-transformers engine."""
+
+    engine = "torch"
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def token_lengths(self, texts):
+        return token_lengths(self.tokenizer, texts, self.max_seq_length)
+
+    def encode(self, texts, batch_size=32):
+        embeddings = self.model.encode(
+            texts, batch_size=batch_size, show_progress_bar=False,
+            convert_to_numpy=True, normalize_embeddings=True
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime engine.
+
+    Model resolution order:
+        1. explicit onnx_path (or ONNX_MODEL_PATH env var)
+        2. client/public/sbert.onnx, if it loads standalone
+        3. one-time export of the Hub model with torch into onnx_dir
+    With quantize=True, a dynamically int8-quantized copy is built once and cached next to it.
+    """
+
+    def __init__(self, model_name, onnx_path=None, quantize=False, onnx_dir=None,
+                 max_seq_length=256, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.engine = "onnx-int8" if quantize else "onnx"
+        self.max_seq_length = max_seq_length
+        self.onnx_dir = os.path.join(onnx_dir or DEFAULT_ONNX_DIR, model_name.replace("/", "__"))
+        self.tokenizer = AutoTokenizer.from_pretrained(hub_name(model_name))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+
+        path = self._resolve_model(onnx_path or os.environ.get("ONNX_MODEL_PATH"), ort, options)
+        if quantize:
+            path = self._quantized(path)
+
+        print(f"⚡ Loading ONNX Runtime session: {path}")
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self._dim = None
+
+    def _resolve_model(self, onnx_path, ort, options):
+        if onnx_path:
+            return onnx_path
+        exported = os.path.join(self.onnx_dir, "model.onnx")
+        if os.path.exists(exported):
+            return exported
+        if os.path.exists(CLIENT_ONNX_PATH):
+            try:
+                ort.InferenceSession(CLIENT_ONNX_PATH, sess_options=options, providers=["CPUExecutionProvider"])
+                return CLIENT_ONNX_PATH
+            except Exception as e:
+                print(f"⚠️ Client ONNX model not usable server-side ({e}). Exporting from Hub model.")
+        return self._export(exported)
+
+    def _export(self, output_path):
+        import torch
+        from transformers import AutoModel
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        print(f"🔄 Exporting {self.model_name} to ONNX: {output_path}")
+        model = AutoModel.from_pretrained(hub_name(self.model_name))
+        model.eval()
+        dummy = self.tokenizer(["export"], return_tensors="pt")
+        names = ["input_ids", "attention_mask", "token_type_ids"]
+        names = [n for n in names if n in dummy]
+        dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(dummy[n] for n in names), output_path,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic, opset_version=14
+            )
+        return output_path
+
+    def _quantized(self, fp32_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(self.onnx_dir, "model.int8.onnx")
+        if not os.path.exists(int8_path):
+            os.makedirs(self.onnx_dir, exist_ok=True)
+            print(f"🔄 Quantizing {fp32_path} to int8...")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def get_sentence_embedding_dimension(self):
+        if self._dim is None:
+            self._dim = self.encode(["dimension probe"]).shape[1]
+        return self._dim
+
+    def token_lengths(self, texts):
+        return token_lengths(self.tokenizer, texts, self.max_seq_length)
+
+    def encode(self, texts, batch_size=32):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            enc = self.tokenizer(
+                batch, padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np"
+            )
+            feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+            hidden = self.session.run(None, feed)[0]
+            # Graphs exported with pooling already applied return (batch, dim)
+            pooled = mean_pool(hidden, enc["attention_mask"]) if hidden.ndim == 3 else hidden
+            out.append(l2_normalize(pooled.astype(np.float32)))
+        if not out:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        return np.vstack(out)
+
+
+def load_embedder(engine, model_name, **kwargs):
+    """Factory for the engine names accepted by StandardBackbone(engine=...)."""
+    if engine == "torch":
+        return TorchEmbedder(model_name)
+    if engine == "onnx":
+        return OnnxEmbedder(model_name, quantize=False, **kwargs)
+    if engine == "onnx-int8":
+        return OnnxEmbedder(model_name, quantize=True, **kwargs)
+    raise ValueError(f"Unknown embedder engine '{engine}'. Expected one of {ENGINES}")
@@ -0,0 +1,334 @@
+"""
+Content-addressed embedding cache for StandardBackbone.
+Two tiers:
+- In-memory LRU of recently used vectors
+- On-disk memory-mapped matrix + key index that survives restarts
+Keys are sha1(model_name + text), so the same task text is only embedded once per model.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from file_lock import FileLock
+
+
+def text_key(model_name, text):
+    """Stable content hash for a (model, text) pair."""
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update((text or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Append-only memory-mapped embedding matrix with a line-per-row key index.
+
+    Layout (inside `directory`):
+        meta.json     - {"dim": ..., "dtype": ...}
+        vectors.bin   - raw (capacity, dim) matrix, grown by doubling
+        index.txt     - one hex key per line; line number == row number
+        store.lock    - flock target; every uWSGI worker shares the directory
+
+    Vectors are written before their key is appended to the index, so a crash
+    mid-write never exposes a half-written row. Writers hold an exclusive lock and
+    first read the index lines other processes appended, so row numbers never collide.
+    Past `max_items` rows the oldest rows are dropped (the newest half is kept).
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory, dim, dtype="float16", max_items=None):
+        self.directory = directory
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.max_items = int(max_items) if max_items else None
+        os.makedirs(directory, exist_ok=True)
+
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._vec_path = os.path.join(directory, "vectors.bin")
+        self._index_path = os.path.join(directory, "index.txt")
+        self._lock = FileLock(os.path.join(directory, "store.lock"))
+
+        self.rows = {}
+        self._n_lines = 0  # rows in the index, including ones without a usable key
+        self._index_offset = 0  # bytes of index.txt already read
+        self._index_ino = None
+        self._capacity = 0
+        self._mm = None
+        with self._lock.hold():
+            self._check_meta()
+            self._reload()
+
+    def _check_meta(self):
+        meta = {"dim": self.dim, "dtype": self.dtype.name}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                existing = json.load(f)
+            if existing == meta:
+                return
+            # Dimension or dtype changed (e.g. new model): start over
+            for path in (self._vec_path, self._index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        with open(self._meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def _reload(self):
+        """Read the whole index and map the matrix (first open, or after a compaction)."""
+        self.rows = {}
+        self._n_lines = 0
+        self._index_offset = 0
+        self._index_ino = os.stat(self._index_path).st_ino if os.path.exists(self._index_path) else None
+        self._read_tail()
+        self._open_matrix(max(self.INITIAL_CAPACITY, self._n_lines))
+
+    def _changed(self):
+        """Did any process append to (or compact) the index since we last read it?"""
+        try:
+            st = os.stat(self._index_path)
+        except FileNotFoundError:
+            return self._index_ino is not None
+        return st.st_ino != self._index_ino or st.st_size != self._index_offset
+
+    def _sync(self):
+        """Pick up rows written by other processes (call with the lock held)."""
+        if not self._changed():
+            return
+        if not os.path.exists(self._index_path) or os.stat(self._index_path).st_ino != self._index_ino:
+            self._reload()
+            return
+        self._read_tail()
+        if self._n_lines > self._capacity:
+            self._open_matrix(self._n_lines)
+
+    def _read_tail(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Complete lines only: a torn last line (crash mid-append) is left for the next writer
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].split(b"\n")[:-1]:
+            key = line.strip().decode("utf-8", "replace")
+            if key:
+                self.rows[key] = self._n_lines
+            self._n_lines += 1
+        self._index_offset += end
+
+    def _open_matrix(self, capacity):
+        row_bytes = self.dim * self.dtype.itemsize
+        if self._mm is not None:
+            self._mm.flush()
+            del self._mm
+        with open(self._vec_path, "ab") as f:
+            if f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        self._capacity = os.path.getsize(self._vec_path) // row_bytes
+        self._mm = np.memmap(self._vec_path, dtype=self.dtype, mode="r+", shape=(self._capacity, self.dim))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def round(self, vectors):
+        """Vectors as they will read back from disk (float32 after the storage dtype)."""
+        return np.asarray(vectors, dtype=self.dtype).astype(np.float32)
+
+    def get_many(self, keys):
+        """Return {key: float32 vector} for the keys present on disk."""
+        if self._changed() and any(key not in self.rows for key in keys):
+            with self._lock.hold(exclusive=False):
+                self._sync()
+        found = {}
+        for key in keys:
+            row = self.rows.get(key)
+            if row is not None:
+                found[key] = np.asarray(self._mm[row], dtype=np.float32)
+        return found
+
+    def put_many(self, keys, vectors):
+        with self._lock.hold():
+            self._sync()
+            new = {}
+            for k, v in zip(keys, vectors):
+                if k not in self.rows and k not in new:
+                    new[k] = v
+            if not new:
+                return
+            new = list(new.items())
+            if self.max_items:
+                new = new[-self.max_items:]
+                if self._n_lines + len(new) > self.max_items:
+                    self._compact(min(self.max_items // 2, self.max_items - len(new)))
+
+            # Terminate a torn last line left by a crashed writer; it counts as a dead row
+            prefix = b""
+            if os.path.exists(self._index_path) and os.path.getsize(self._index_path) > self._index_offset:
+                prefix = b"\n"
+                self._n_lines += 1
+            start = self._n_lines
+            needed = start + len(new)
+            if needed > self._capacity:
+                self._open_matrix(max(needed, self._capacity * 2))
+
+            block = np.asarray([v for _, v in new], dtype=self.dtype)
+            self._mm[start:needed] = block
+            self._mm.flush()
+
+            data = prefix + "".join(k + "\n" for k, _ in new).encode("utf-8")
+            with open(self._index_path, "ab") as f:
+                f.write(data)
+            if self._index_ino is None:
+                self._index_ino = os.stat(self._index_path).st_ino
+            self._index_offset = os.path.getsize(self._index_path)
+            for offset, (key, _) in enumerate(new):
+                self.rows[key] = start + offset
+            self._n_lines = needed
+
+    def _compact(self, keep):
+        """Rewrite the store with only the newest `keep` rows (call with the exclusive lock held)."""
+        newest = sorted(self.rows.items(), key=lambda kv: kv[1])[-keep:] if keep > 0 else []
+        rows = np.fromiter((row for _, row in newest), dtype=np.int64, count=len(newest))
+        block = np.asarray(self._mm[rows], dtype=self.dtype)
+        vec_tmp, index_tmp = self._vec_path + ".tmp", self._index_path + ".tmp"
+        with open(vec_tmp, "wb") as f:
+            f.write(block.tobytes())
+        with open(index_tmp, "w", encoding="utf-8") as f:
+            f.write("".join(key + "\n" for key, _ in newest))
+        # Matrix first: a reader that sees the new index always maps the new matrix
+        os.replace(vec_tmp, self._vec_path)
+        os.replace(index_tmp, self._index_path)
+        self._reload()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+        self._lock.close()
+
+
+class EmbeddingCache:
+    """
+    Two-tier (LRU memory + memory-mapped disk) cache in front of an embed function.
+
+    Usage:
+        cache = EmbeddingCache("all-MiniLM-L6-v2", dim=384, cache_dir="./embedding_cache")
+        X = cache.embed(texts, compute_fn)   # compute_fn only sees the misses
+    """
+
+    def __init__(self, model_name, dim, cache_dir=None, max_memory_items=50000, disk_dtype="float16",
+                 max_disk_items=None):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.max_memory_items = int(max_memory_items)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.disk = None
+        if cache_dir:
+            safe_name = model_name.replace("/", "__")
+            self.disk = DiskEmbeddingStore(os.path.join(cache_dir, safe_name), dim, dtype=disk_dtype,
+                                           max_items=max_disk_items)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def lookup(self, keys):
+        """
+        Resolve keys against both tiers.
+
+        Returns:
+            (found, missing): dict of key -> vector, and list of unique missing keys
+        """
+        found = {}
+        pending = []
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vec
+                    self.memory_hits += 1
+                else:
+                    pending.append(key)
+
+            missing = []
+            if pending and self.disk is not None:
+                on_disk = self.disk.get_many(pending)
+                for key, vec in on_disk.items():
+                    found[key] = vec
+                    self._remember(key, vec)
+                    self.disk_hits += 1
+                missing = [k for k in pending if k not in on_disk]
+            else:
+                missing = pending
+            missing = list(dict.fromkeys(missing))
+            self.misses += len(missing)
+        return found, missing
+
+    def store(self, keys, vectors):
+        """Cache vectors in both tiers. Returns them as a later lookup will (rounded to the disk dtype)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.disk is not None:
+            # Memory hits must match disk hits, so a text embeds the same after a restart
+            vectors = self.disk.round(vectors)
+        with self._lock:
+            for key, vec in zip(keys, vectors):
+                self._remember(key, vec)
+            if self.disk is not None:
+                self.disk.put_many(keys, vectors)
+        return vectors
+
+    def embed(self, texts, compute_fn):
+        """
+        Embed texts, computing only the cache misses with `compute_fn(list_of_texts)`.
+
+        Returns:
+            np.ndarray of shape (n_texts, dim), float32, in input order
+        """
+        keys = [text_key(self.model_name, t) for t in texts]
+        found, missing = self.lookup(keys)
+
+        if missing:
+            first_text = {}
+            for key, text in zip(keys, texts):
+                first_text.setdefault(key, text)
+            computed = np.asarray(compute_fn([first_text[k] for k in missing]), dtype=np.float32)
+            computed = self.store(missing, computed)
+            for key, vec in zip(missing, computed):
+                found[key] = vec
+
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            out[i] = found[key]
+        return out
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "memory_items": len(self._memory),
+            "disk_items": len(self.disk) if self.disk is not None else 0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
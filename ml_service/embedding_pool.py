@@ -0,0 +1,86 @@
+"""
+Multi-process embedding pool.
+Shards large text batches across N worker processes, each holding its own embedder,
+and reassembles the results in input order. Workers are pinned to a few intra-op
+threads each, so N workers scale across cores instead of fighting over one thread pool.
+"""
+import os
+import math
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Per-process state inside pool workers
+_worker_pipeline = None
+
+
+def _init_worker(engine, model_name, batch_size, threads_per_worker):
+    global _worker_pipeline
+    threads = str(threads_per_worker)
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+    from embedders import load_embedder
+    from encoding_pipeline import EncodingPipeline
+
+    kwargs = {} if engine == "torch" else {"num_threads": threads_per_worker}
+    embedder = load_embedder(engine, model_name, **kwargs)
+    _worker_pipeline = EncodingPipeline(
+        embedder.encode, embedder.token_lengths,
+        embedder.get_sentence_embedding_dimension(), batch_size=batch_size
+    )
+
+
+def _embed_shard(texts):
+    return _worker_pipeline.encode(texts)
+
+
+class EmbeddingPool:
+    """
+    Args:
+        engine: embedder engine name (see embedders.ENGINES)
+        model_name: sentence-transformers model name
+        num_workers: number of worker processes
+        batch_size: micro-batch size used inside each worker
+        max_shard_size: upper bound on texts sent to a worker per task
+    """
+
+    def __init__(self, engine, model_name, num_workers, batch_size=64, max_shard_size=4096):
+        self.num_workers = int(num_workers)
+        self.batch_size = int(batch_size)
+        self.max_shard_size = int(max_shard_size)
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        print(f"⚡ Starting embedding pool: {self.num_workers} workers x {threads_per_worker} threads")
+        # spawn: forking a process that already initialized torch/tokenizers is unsafe
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(engine, model_name, self.batch_size, threads_per_worker),
+        )
+        atexit.register(self.shutdown)
+
+    def _shard_size(self, n):
+        # ~4 shards per worker keeps everyone busy when shard costs differ
+        size = math.ceil(n / (self.num_workers * 4))
+        return max(self.batch_size, min(size, self.max_shard_size))
+
+    def encode(self, texts):
+        """Embed texts across the pool. Returns (n, dim) float32 in input order."""
+        texts = list(texts)
+        size = self._shard_size(len(texts))
+        shards = [texts[i:i + size] for i in range(0, len(texts), size)]
+        # map() yields in submission order, so concatenation restores input order
+        return np.vstack(list(self.executor.map(_embed_shard, shards)))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,257 @@
+"""
+Shared embedding sidecar.
+One process holds the transformer and serves every uWSGI worker over a Unix socket,
+so the model weights and the torch thread pool exist once per machine instead of
+once per worker. Embeddings travel back through a shared-memory buffer owned by
+each client; the socket only carries small JSON control frames.
+
+Run:
+    python embedding_server.py --socket /tmp/cal-log-embed.sock --engine onnx-int8
+Then start the workers with EMBED_SERVER_SOCKET=/tmp/cal-log-embed.sock.
+
+Frame: 4-byte big-endian length + UTF-8 JSON.
+Requests:
+    {"op": "info"}
+    {"op": "token_lengths", "texts": [...]}
+    {"op": "embed", "texts": [...], "shm": "<segment name>"}  -> rows written to the segment
+"""
+import os
+import json
+import struct
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+
+
+def _send(sock, payload):
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+def _attach(name):
+    """Attach to a client's segment without letting this process's resource tracker own it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+# ----------------------------------------------------------------------
+# Server
+# ----------------------------------------------------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service = self.server.service
+        segment = None  # this client's current shared-memory buffer
+        try:
+            while True:
+                try:
+                    request = _recv(self.request)
+                except ConnectionError:
+                    return
+                op = request.get("op")
+                try:
+                    if op == "info":
+                        _send(self.request, service.info())
+                    elif op == "token_lengths":
+                        lengths = service.token_lengths(request["texts"])
+                        _send(self.request, {"ok": True, "lengths": [int(n) for n in lengths]})
+                    elif op == "embed":
+                        if segment is None or segment.name.lstrip("/") != request["shm"].lstrip("/"):
+                            if segment is not None:
+                                segment.close()
+                            segment = _attach(request["shm"])
+                        n = service.embed_into(request["texts"], segment)
+                        _send(self.request, {"ok": True, "n": n, "dim": service.dim})
+                    else:
+                        _send(self.request, {"ok": False, "error": f"unknown op {op!r}"})
+                except Exception as e:
+                    logger.exception(f"Embedding request failed: {e}")
+                    _send(self.request, {"ok": False, "error": str(e)})
+        finally:
+            if segment is not None:
+                segment.close()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class EmbeddingService:
+    """The single embedder behind the socket. Encodes one request at a time on all cores."""
+
+    def __init__(self, engine, model_name, batch_size=64):
+        from embedders import load_embedder
+        from encoding_pipeline import EncodingPipeline
+
+        self.engine = engine
+        self.model_name = model_name
+        self.embedder = load_embedder(engine, model_name)
+        self.dim = self.embedder.get_sentence_embedding_dimension()
+        self.pipeline = EncodingPipeline(
+            self.embedder.encode, self.embedder.token_lengths, self.dim, batch_size=batch_size
+        )
+        # One encode at a time: concurrent requests would only split the same cores
+        self._lock = threading.Lock()
+
+    def info(self):
+        return {"ok": True, "engine": self.engine, "model_name": self.model_name, "dim": self.dim,
+                "max_seq_length": getattr(self.embedder, "max_seq_length", None)}
+
+    def token_lengths(self, texts):
+        return self.embedder.token_lengths(texts)
+
+    def embed_into(self, texts, segment):
+        out = np.ndarray((len(texts), self.dim), dtype=np.float32, buffer=segment.buf)
+        with self._lock:
+            out[:] = self.pipeline.encode(texts)
+        return len(texts)
+
+
+def serve(socket_path, engine="torch", model_name="all-MiniLM-L6-v2", batch_size=64):
+    """Load the embedder once and serve it on `socket_path` until interrupted."""
+    service = EmbeddingService(engine, model_name, batch_size=batch_size)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = _Server(socket_path, _Handler)
+    server.service = service
+    os.chmod(socket_path, 0o660)
+    print(f"✅ Embedding server ready on {socket_path} ({model_name}, engine={engine}, dim={service.dim})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+class EmbeddingClient:
+    """
+    Embedder backed by the sidecar. Same contract as the local engines
+    (encode / token_lengths / get_sentence_embedding_dimension), so StandardBackbone
+    can use it in place of load_embedder(); no torch or model weights in this process.
+    """
+
+    def __init__(self, socket_path, timeout=300.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._lock = threading.RLock()  # held across request + copy-out of the shared buffer
+        self._sock = None
+        self._shm = None
+        info = self._call({"op": "info"})
+        self.engine = info["engine"]
+        self.model_name = info["model_name"]
+        self.dim = int(info["dim"])
+        self.max_seq_length = info.get("max_seq_length")
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._sock = sock
+
+    def _call(self, request):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    _send(self._sock, request)
+                    response = _recv(self._sock)
+                    break
+                except (ConnectionError, OSError):
+                    # Server restarted or the socket was dropped: reconnect once
+                    self._close_socket()
+                    if attempt:
+                        raise
+            if not response.get("ok"):
+                raise RuntimeError(f"embedding server error: {response.get('error')}")
+            return response
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _buffer(self, n_rows):
+        # Grow by doubling; the server re-attaches when the segment name changes
+        needed = max(1, n_rows) * self.dim * 4
+        if self._shm is None or self._shm.size < needed:
+            size = max(needed, 2 * self._shm.size if self._shm is not None else 0)
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        return self._shm
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def token_lengths(self, texts):
+        return self._call({"op": "token_lengths", "texts": list(texts)})["lengths"]
+
+    def encode(self, texts, batch_size=None):
+        """L2-normalized float32 embeddings (n, dim); the server sorts and micro-batches."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with self._lock:
+            shm = self._buffer(len(texts))
+            self._call({"op": "embed", "texts": texts, "shm": shm.name})
+            # Copy out: the buffer is reused by the next request
+            return np.ndarray((len(texts), self.dim), dtype=np.float32, buffer=shm.buf).copy()
+
+    def close(self):
+        with self._lock:
+            self._close_socket()
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared embedding server for CAL-Log workers")
+    parser.add_argument("--socket", default=os.environ.get("EMBED_SERVER_SOCKET", "/tmp/cal-log-embed.sock"))
+    parser.add_argument("--engine", default=os.environ.get("EMBEDDER_ENGINE", "torch"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get("EMBED_BATCH_SIZE", 64)))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket, engine=args.engine, model_name=args.model, batch_size=args.batch_size)
@@ -0,0 +1,53 @@
+"""
+Length-bucketed encoding pipeline.
+Large embed requests are processed chunk by chunk (bounded memory). Inside each chunk,
+texts are sorted by token length and encoded in micro-batches, so short headlines are
+never padded up to the length of long articles. Results are scattered back to input order.
+"""
+import numpy as np
+
+
+class EncodingPipeline:
+    """
+    Args:
+        encode_fn: callable(list_of_texts, batch_size) -> np.ndarray (n, dim)
+        length_fn: callable(list_of_texts) -> sequence of token lengths
+        dim: embedding dimension
+        batch_size: micro-batch size handed to the encoder
+        chunk_size: number of texts materialized at once when streaming
+    """
+
+    def __init__(self, encode_fn, length_fn, dim, batch_size=64, chunk_size=4096):
+        self.encode_fn = encode_fn
+        self.length_fn = length_fn
+        self.dim = int(dim)
+        self.batch_size = max(1, int(batch_size))
+        self.chunk_size = max(self.batch_size, int(chunk_size))
+
+    def _encode_chunk(self, texts):
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        lengths = np.asarray(self.length_fn(texts))
+        # Stable sort keeps equal-length texts in input order (deterministic batches)
+        order = np.argsort(lengths, kind="stable")
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            batch = [texts[i] for i in idx]
+            out[idx] = self.encode_fn(batch, batch_size=len(batch))
+        return out
+
+    def stream(self, texts):
+        """
+        Yield (start, embeddings) per chunk, in input order.
+        Only one chunk of embeddings is alive at a time.
+        """
+        for start in range(0, len(texts), self.chunk_size):
+            yield start, self._encode_chunk(texts[start:start + self.chunk_size])
+
+    def encode(self, texts):
+        """Encode all texts into one (n, dim) float32 array."""
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start, emb in self.stream(texts):
+            out[start:start + len(emb)] = emb
+        return out
@@ -0,0 +1,52 @@
+"""
+Per-task text feature store.
+Word count, log1p(word count) and tokenizer token count are computed once per text,
+in one batched pass at ingestion, then served from the same two-tier
+(memory LRU + memory-mapped disk) cache used for embeddings.
+"""
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+COLUMNS = ("word_count", "log_length", "token_count")
+
+
+class FeatureStore:
+    """
+    Usage:
+        features = FeatureStore(embedder.token_lengths, "all-MiniLM-L6-v2", cache_dir="./embedding_cache")
+        lengths = features.word_counts(texts)   # computed once per text, then cached
+    """
+
+    def __init__(self, token_length_fn, namespace, cache_dir=None, max_memory_items=200000,
+                 max_disk_items=2000000):
+        self.token_length_fn = token_length_fn
+        # Token counts depend on the tokenizer, so features live in the model's namespace
+        self.cache = EmbeddingCache(f"{namespace}#features", len(COLUMNS), cache_dir=cache_dir,
+                                    max_memory_items=max_memory_items, disk_dtype="float32",
+                                    max_disk_items=max_disk_items)
+
+    def _compute(self, texts):
+        word_counts = np.fromiter((len(t.split()) for t in texts), dtype=np.float32, count=len(texts))
+        token_counts = np.asarray(self.token_length_fn(texts), dtype=np.float32)
+        return np.column_stack([word_counts, np.log1p(word_counts), token_counts])
+
+    def features(self, texts):
+        """
+        Returns: np.ndarray of shape (n_texts, 3) with columns COLUMNS
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        return self.cache.embed(list(texts), self._compute)
+
+    def word_counts(self, texts):
+        return self.features(texts)[:, 0].astype(np.int64)
+
+    def log_lengths(self, texts):
+        return self.features(texts)[:, 1].astype(np.float64)
+
+    def token_counts(self, texts):
+        return self.features(texts)[:, 2].astype(np.int64)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,55 @@
+"""
+Advisory inter-process lock (flock) for files shared by every uWSGI worker
+(embedding cache, pool store, state journal, interaction log).
+Without fcntl (Windows) it only serializes the threads of this process.
+
+Usage:
+    lock = FileLock("state.json.lock")
+    with lock.hold():                 # exclusive
+        ...
+    with lock.hold(exclusive=False):  # shared
+        ...
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        # flock does not exclude threads sharing one descriptor, so threads queue here first
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def _fileno(self):
+        if self._pid != os.getpid():
+            # Forked: an inherited descriptor would share the parent's lock, so open our own
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def hold(self, exclusive=True):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            fd = self._fileno()
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = None
+        self._pid = None
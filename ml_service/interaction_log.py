@@ -0,0 +1,202 @@
+"""
+Durable per-annotator interaction history.
+Append-only binary log of accepted cost-model observations, so AdaptiveCostModel
+sliding windows survive restarts.
+
+Record (20 bytes, little-endian): user index (uint32), log-length feature (float32),
+seconds (float32), unix timestamp (float64). User ids are mapped to indices in a
+small JSON sidecar. Compaction rewrites the log with only each user's last window.
+
+Every uWSGI worker appends to the same files. Appends and compaction hold an exclusive
+flock, and first reload the sidecar and fold in records other workers appended,
+so user indices and windows are shared by all workers.
+"""
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from file_lock import FileLock
+
+RECORD = np.dtype([("user", "<u4"), ("x", "<f4"), ("y", "<f4"), ("ts", "<f8")])
+
+
+class InteractionLog:
+    """
+    Usage:
+        log = InteractionLog("interactions.log", window=50)
+        windows = log.load()              # {user_id: [(x, y), ...]} - last `window` per user
+        log.append(user_id, [(x, y), ...])
+    """
+
+    def __init__(self, path, window=50, compact_factor=4, min_compact_records=10000):
+        self.path = path
+        self.users_path = path + ".users.json"
+        self.window = int(window)
+        self.compact_factor = compact_factor
+        self.min_compact_records = min_compact_records
+        self._lock = threading.Lock()
+        self._flock = FileLock(path + ".lock")  # shared with the other workers
+        self._file = None
+        self._user_index = {}   # user id -> uint32
+        self._offsets = {}      # user index -> record numbers (last `window`)
+        self._records = 0
+        self._users_sig = None  # sidecar (inode, mtime, size) when last read
+        self._inode = None      # log inode when last read (changes when a worker compacts)
+
+    # ------------------------------------------------------------------
+    def _save_users(self):
+        tmp = self.users_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._user_index, f)
+        os.replace(tmp, self.users_path)
+        self._users_sig = self._signature(self.users_path)
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _sync_users(self):
+        """Reload the sidecar if another worker added users (flock held)."""
+        sig = self._signature(self.users_path)
+        if sig is not None and sig != self._users_sig:
+            with open(self.users_path, "r") as f:
+                self._user_index = {str(k): int(v) for k, v in json.load(f).items()}
+            self._users_sig = sig
+
+    def _read_records(self, start=0):
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=RECORD)
+        count = os.path.getsize(self.path) // RECORD.itemsize - start
+        # A torn final record (crash mid-append) is ignored
+        return np.fromfile(self.path, dtype=RECORD, count=max(0, count), offset=start * RECORD.itemsize)
+
+    def _index_records(self, records):
+        self._offsets = {}
+        if len(records) == 0:
+            return
+        order = np.argsort(records["user"], kind="stable")
+        users, starts = np.unique(records["user"][order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        for user, start, end in zip(users.tolist(), starts.tolist(), bounds):
+            self._offsets[user] = order[max(start, end - self.window):end].tolist()
+
+    def _add_offsets(self, users, start):
+        touched = set()
+        for i, user in enumerate(users.tolist()):
+            self._offsets.setdefault(user, []).append(start + i)
+            touched.add(user)
+        for user in touched:
+            del self._offsets[user][:-self.window]
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _reindex(self):
+        """Read the whole log and index every user's window (flock held). Returns the records."""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size % RECORD.itemsize:
+            # Drop a torn tail so later appends stay aligned
+            with open(self.path, "ab") as f:
+                f.truncate(size - size % RECORD.itemsize)
+        records = self._read_records()
+        self._records = len(records)
+        self._index_records(records)
+        self._inode = os.stat(self.path).st_ino if os.path.exists(self.path) else None
+        self._close_file()
+        return records
+
+    def _sync_records(self):
+        """Fold in records other workers appended; re-index if one of them compacted (flock held)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._inode or st.st_size < self._records * RECORD.itemsize \
+                or st.st_size % RECORD.itemsize:
+            self._reindex()
+            return
+        tail = self._read_records(start=self._records)
+        if len(tail):
+            self._add_offsets(tail["user"], self._records)
+            self._records += len(tail)
+
+    def load(self):
+        """
+        Read the log and index each user's latest window.
+        Returns: {user_id: [(x, y), ...]} oldest first
+        """
+        with self._lock, self._flock.hold():
+            self._users_sig = None
+            self._sync_users()
+            records = self._reindex()
+
+            names = {idx: uid for uid, idx in self._user_index.items()}
+            return {
+                names[user]: [(float(records["x"][r]), float(records["y"][r])) for r in rows]
+                for user, rows in self._offsets.items() if user in names
+            }
+
+    def offsets(self, user_id):
+        """Record numbers of the user's current window (oldest first)."""
+        idx = self._user_index.get(str(user_id))
+        return list(self._offsets.get(idx, []))
+
+    def append(self, user_id, points):
+        """Append (x, y) observations for one user. Cheap: one small buffered write + flush."""
+        if not points:
+            return
+        with self._lock, self._flock.hold():
+            self._sync_users()
+            self._sync_records()
+            uid = str(user_id)
+            if uid not in self._user_index:
+                self._user_index[uid] = max(self._user_index.values(), default=-1) + 1
+                self._save_users()
+            idx = self._user_index[uid]
+
+            now = time.time()
+            batch = np.array([(idx, x, y, now) for x, y in points], dtype=RECORD)
+            if self._file is None:
+                self._file = open(self.path, "ab")
+                self._inode = os.fstat(self._file.fileno()).st_ino
+            self._file.write(batch.tobytes())
+            self._file.flush()
+
+            self._add_offsets(batch["user"], self._records)
+            self._records += len(batch)
+
+            live = sum(len(r) for r in self._offsets.values())
+            if self._records >= self.min_compact_records and self._records > self.compact_factor * live:
+                self._compact()
+
+    def _compact(self):
+        # Keep only each user's window; write aside then atomically swap in (flock held)
+        self._close_file()
+        records = self._read_records()
+        rows = [np.asarray(r, dtype=np.int64) for r in self._offsets.values()]
+        keep = np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+        kept = records[keep]
+        tmp = self.path + ".compact"
+        kept.tofile(tmp)
+        os.replace(tmp, self.path)
+        self._records = len(kept)
+        self._index_records(kept)
+        self._inode = os.stat(self.path).st_ino
+
+    def compact(self):
+        with self._lock, self._flock.hold():
+            self._sync_records()
+            self._compact()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
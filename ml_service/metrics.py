@@ -0,0 +1,230 @@
+"""
+Low-overhead in-process metrics with Prometheus text exposition.
+Histograms with fixed buckets (one bisect + three adds per observation), counters,
+and callback gauges evaluated only at scrape time. Values are per process: under
+uWSGI each worker reports its own series.
+
+Also: MetricsRing, a bounded in-memory event log (training metrics for the
+Spy Window) that readers follow by sequence number, with blocking waits for long-poll
+and Server-Sent Events.
+
+Usage:
+    from metrics import STAGE_SECONDS, timer
+    with timer("embed"):
+        ...
+    text = REGISTRY.render()
+"""
+import time
+import threading
+from collections import deque
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds: 100us .. 30s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Items per call: 1 .. 65536
+SIZE_BUCKETS = tuple(float(2 ** i) for i in range(17))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge read from a callback at scrape time.
+    The callback returns a number, None (series omitted), or a
+    {label value tuple: number} dict when `labelnames` is set.
+    """
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception:
+            value = None
+        if value is None:
+            return lines
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labelvalues, v in sorted(items):
+            if v is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. module reload) keeps the first instance
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._register(Histogram(name, help_text, buckets, labelnames))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, fn, labelnames=()):
+        gauge = Gauge(name, help_text, fn, labelnames)
+        with self._lock:
+            self._metrics[name] = gauge  # latest callback wins
+        return gauge
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "cal_log_stage_seconds", "Time spent per pipeline stage", labelnames=("stage",))
+BATCH_SIZE = REGISTRY.histogram(
+    "cal_log_batch_size", "Items per call", buckets=SIZE_BUCKETS, labelnames=("op",))
+REQUESTS = REGISTRY.counter(
+    "cal_log_requests_total", "Backend calls by operation", labelnames=("op",))
+
+
+@contextmanager
+def timer(stage):
+    """Record the wall time of the block under cal_log_stage_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+
+def observe_batch(op, size):
+    BATCH_SIZE.observe(size, op)
+
+
+class MetricsRing:
+    """
+    Last `capacity` metric records, each stamped with a sequence number and time.
+    Writers never block on readers and nothing touches the filesystem.
+
+    Usage:
+        ring = MetricsRing(1024)
+        ring.push({"train_step": 3, "current_alpha": 4.2})
+        records = ring.wait(since=last_seq, timeout=25)   # [] on timeout
+    """
+
+    def __init__(self, capacity=1024):
+        self._records = deque(maxlen=int(capacity))
+        self._cond = threading.Condition()
+        self._seq = 0
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def push(self, record):
+        with self._cond:
+            self._seq += 1
+            entry = dict(record, seq=self._seq, ts=time.time())
+            self._records.append(entry)
+            self._cond.notify_all()
+            return entry
+
+    def since(self, seq=0):
+        """Records newer than `seq` that are still in the ring, oldest first."""
+        with self._cond:
+            if seq > self._seq:
+                seq = 0  # reader is ahead of us: the process restarted
+            return [r for r in self._records if r["seq"] > seq]
+
+    def latest(self):
+        with self._cond:
+            return self._records[-1] if self._records else None
+
+    def wait(self, since=0, timeout=None):
+        """Block until a record newer than `since` exists (or timeout). Returns the new records."""
+        with self._cond:
+            if since > self._seq:
+                since = 0  # reader is ahead of us: the process restarted
+            self._cond.wait_for(lambda: self._seq > since, timeout)
+            return [r for r in self._records if r["seq"] > since]
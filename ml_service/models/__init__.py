@@ -1,5 +1,7 @@
 """Models package for CAL-Log Active Learning."""
-from .cal_log_ranker import CALLogRanker
-from .cal_log_ranker import CALLogRanker
+from .cal_log_ranker import CALLogRanker, RankedTasks, iter_task_chunks, top_k_indices
+from .redundancy import IVFIndex, RedundancyEngine
+from .priority_queue import IndexedMaxHeap, PoolPriorityQueue
 
-__all__ = ['CALLogRanker']
+__all__ = ['CALLogRanker', 'RankedTasks', 'iter_task_chunks', 'top_k_indices', 'IVFIndex', 'RedundancyEngine',
+           'IndexedMaxHeap', 'PoolPriorityQueue']
@@ -2,15 +2,129 @@
 CAL-Log Ranker: Pure entropy-based task ranking logic.
 Implements the core CAL-Log formula: Score = Entropy / Cost
 """
+import json
 import numpy as np
-from typing import List, Dict, Any
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Union
+
+
+def top_k_indices(values: np.ndarray, k: Optional[int], descending: bool = True) -> np.ndarray:
+    """
+    Indices of the k best values, sorted.
+    Uses partial selection (argpartition) so only the k winners get fully sorted.
+    
+    Args:
+        values: Shape (n,)
+        k: Number of indices to return (None = all)
+        descending: True for largest-first, False for smallest-first
+    
+    Returns:
+        indices: Shape (min(k, n),)
+    """
+    keys = -values if descending else values
+    n = len(keys)
+    if k is None or k >= n:
+        return np.argsort(keys, kind="stable")
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(keys, k - 1)[:k]
+    # Resolve ties at the k-th value by input position, so the result is
+    # exactly the first k entries of a stable full sort
+    kth = keys[part].max()
+    strict = np.flatnonzero(keys < kth)
+    ties = np.flatnonzero(keys == kth)[:k - len(strict)]
+    selected = np.concatenate([strict, ties])
+    return selected[np.argsort(keys[selected], kind="stable")]
+
+
+def iter_task_chunks(path: str, chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Read a JSONL task export in chunks of {'taskId', 'text'} dicts.
+    Accepts ranker-style lines ({'taskId', 'text'}) or Label Studio tasks ({'id', 'data': {...}}).
+    """
+    chunk = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            if 'taskId' not in task:
+                data = task.get('data', {})
+                task = {'taskId': task.get('id'), 'text': data.get('text') or data.get('content') or ""}
+            chunk.append(task)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class RankedTasks:
+    """
+    Columnar ranking result.
+    
+    Aligned NumPy arrays for the returned items only (`indices` into the input task list,
+    `ids`, `scores`, ...). Task text and transparency reports are attached lazily:
+    dicts are only built when an item is accessed or `to_list()` is called.
+    """
+    
+    def __init__(self, tasks, indices, scores, label_index, confidence, costs, entropy,
+                 penalties, cal_log_scores, phase, context_penalty):
+        self._tasks = tasks
+        self.indices = indices
+        self.ids = [tasks[i]['taskId'] for i in indices]
+        self.scores = scores
+        self.label_index = label_index
+        self.confidence = confidence
+        self.costs = costs
+        self.entropy = entropy
+        self.penalties = penalties
+        self.cal_log_scores = cal_log_scores
+        self.phase = phase
+        self.context_penalty = context_penalty
+    
+    def __len__(self):
+        return len(self.indices)
+    
+    def __getitem__(self, pos: int) -> Dict[str, Any]:
+        idx = self.indices[pos]
+        return {
+            "id": self.ids[pos],
+            "text": self._tasks[idx]['text'],
+            "score": float(self.scores[pos]),
+            "prediction": {
+                "label_index": int(self.label_index[pos]),
+                "confidence": float(self.confidence[pos])
+            },
+            "transparency_report": {
+                "phase": self.phase,
+                "cost_analysis": {
+                    "predicted_seconds": float(self.costs[pos]),
+                    "context_penalty": self.context_penalty
+                },
+                "math_proof": {
+                    "entropy": float(self.entropy[pos]),
+                    "redundancy_penalty": float(self.penalties[pos]),
+                    "cal_log_score": float(self.cal_log_scores[pos])
+                }
+            }
+        }
+    
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self[pos]
+    
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self)
 
 
 class CALLogRanker:
     """Ranks tasks by information value per unit of annotation cost."""
     
-    def __init__(self, cost_model):
+    def __init__(self, cost_model, feature_store=None):
         self.cost_model = cost_model
+        # Optional FeatureStore: word counts are read from it instead of re-splitting texts
+        self.feature_store = feature_store
     
     def calculate_entropy(self, probabilities: np.ndarray) -> np.ndarray:
         """
@@ -37,16 +151,21 @@ class CALLogRanker:
         Returns:
             costs: Shape (n_tasks,) - Predicted seconds to annotate
         """
-        lengths = [len(t.split()) for t in texts]
+        if self.feature_store is not None:
+            lengths = self.feature_store.word_counts(texts)
+        else:
+            lengths = [len(t.split()) for t in texts]
         costs = self.cost_model.predict(lengths)
         return costs
     
     def rank_by_cal_log(
-        self, 
-        tasks: List[Dict[str, Any]], 
+        self,
+        tasks: List[Dict[str, Any]],
         probabilities: np.ndarray,
-        penalties: np.ndarray = None
-    ) -> List[Dict[str, Any]]:
+        penalties: np.ndarray = None,
+        top_k: Optional[int] = None,
+        columnar: bool = False
+    ) -> Union[List[Dict[str, Any]], RankedTasks]:
         """
         Rank tasks by CAL-Log score (Entropy / Cost).
         
@@ -54,11 +173,16 @@ class CALLogRanker:
             tasks: List of task dictionaries with 'taskId' and 'text'
             probabilities: Model predictions, shape (n_tasks, n_classes)
             penalties: Optional redundancy penalties, shape (n_tasks,)
+            top_k: Only return the k best tasks (partial selection, no full sort)
+            columnar: Return a lazy RankedTasks instead of a list of dicts
         
         Returns:
             ranked_tasks: Sorted list with scores and transparency reports
         """
         texts = [t['text'] for t in tasks]
+        # Plain lists are accepted too; they are indexed by the selected order below
+        probabilities = np.asarray(probabilities, dtype=float)
+        penalties = None if penalties is None else np.asarray(penalties, dtype=float)
         
         # Calculate components
         entropy = self.calculate_entropy(probabilities)
@@ -74,51 +198,39 @@ class CALLogRanker:
             final_scores = scores
             penalties = np.ones(len(tasks))  # No penalty
         
-        # Sort by descending score
-        sorted_indices = np.argsort(final_scores)[::-1]
-        
-        # Build response
-        ranked_tasks = []
-        for idx in sorted_indices:
-            # Skip tasks with zero or negative scores
-            if final_scores[idx] <= 0:
-                continue
-            
-            task_resp = {
-                "id": tasks[idx]['taskId'],
-                "text": tasks[idx]['text'],
-                "score": float(final_scores[idx]),
-                "prediction": {
-                    "label_index": int(np.argmax(probabilities[idx])),
-                    "confidence": float(np.max(probabilities[idx]))
-                },
-                "transparency_report": {
-                    "phase": "CAL-Log Active",
-                    "cost_analysis": {
-                        "predicted_seconds": float(costs[idx]),
-                        "context_penalty": "Adaptive"
-                    },
-                    "math_proof": {
-                        "entropy": float(entropy[idx]),
-                        "redundancy_penalty": float(penalties[idx]),
-                        "cal_log_score": float(scores[idx])
-                    }
-                }
-            }
-            ranked_tasks.append(task_resp)
+        # Skip tasks with zero or negative scores, then select the best
+        candidates = np.flatnonzero(final_scores > 0)
+        order = candidates[top_k_indices(final_scores[candidates], top_k)]
         
-        return ranked_tasks
+        probs = probabilities[order]
+        ranked = RankedTasks(
+            tasks, order,
+            scores=final_scores[order],
+            label_index=np.argmax(probs, axis=1),
+            confidence=np.max(probs, axis=1),
+            costs=costs[order],
+            entropy=entropy[order],
+            penalties=penalties[order],
+            cal_log_scores=scores[order],
+            phase="CAL-Log Active",
+            context_penalty="Adaptive"
+        )
+        return ranked if columnar else ranked.to_list()
     
     def rank_cold_start(
-        self, 
-        tasks: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
+        self,
+        tasks: List[Dict[str, Any]],
+        top_k: Optional[int] = 50,
+        columnar: bool = False
+    ) -> Union[List[Dict[str, Any]], RankedTasks]:
         """
         Rank tasks during cold start (no model yet).
         Uses cost-only ranking (shorter tasks first).
         
         Args:
             tasks: List of task dictionaries
+            top_k: Number of tasks to return (default 50)
+            columnar: Return a lazy RankedTasks instead of a list of dicts
         
         Returns:
             ranked_tasks: Sorted by ascending cost
@@ -127,36 +239,30 @@ class CALLogRanker:
         costs = self.calculate_costs(texts)
         
         # Sort by ascending cost (cheaper first)
-        sorted_indices = np.argsort(costs)
-        
-        ranked_tasks = []
-        for idx in sorted_indices[:50]:  # Return top 50
-            ranked_tasks.append({
-                "id": tasks[idx]['taskId'],
-                "text": tasks[idx]['text'],
-                "score": 1.0 / costs[idx],  # Inverse cost as score
-                "prediction": {"label_index": 0, "confidence": 0.5},
-                "transparency_report": {
-                    "phase": "Cold Start (Cost-Only)",
-                    "cost_analysis": {
-                        "predicted_seconds": float(costs[idx]),
-                        "context_penalty": "None"
-                    },
-                    "math_proof": {
-                        "entropy": 0.0,
-                        "redundancy_penalty": 1.0,
-                        "cal_log_score": 0.0
-                    }
-                }
-            })
+        order = top_k_indices(costs, top_k, descending=False)
         
-        return ranked_tasks
+        k = len(order)
+        ranked = RankedTasks(
+            tasks, order,
+            scores=1.0 / costs[order],  # Inverse cost as score
+            label_index=np.zeros(k, dtype=int),
+            confidence=np.full(k, 0.5),
+            costs=costs[order],
+            entropy=np.zeros(k),
+            penalties=np.ones(k),
+            cal_log_scores=np.zeros(k),
+            phase="Cold Start (Cost-Only)",
+            context_penalty="None"
+        )
+        return ranked if columnar else ranked.to_list()
     
     def rank_by_entropy_only(
-        self, 
-        tasks: List[Dict[str, Any]], 
-        probabilities: np.ndarray
-    ) -> List[Dict[str, Any]]:
+        self,
+        tasks: List[Dict[str, Any]],
+        probabilities: np.ndarray,
+        top_k: Optional[int] = None,
+        columnar: bool = False
+    ) -> Union[List[Dict[str, Any]], RankedTasks]:
         """
         Rank tasks by entropy only (ignore cost).
         Used for Entropy-only baseline strategy.
@@ -164,46 +270,168 @@ class CALLogRanker:
         Args:
             tasks: List of task dictionaries
             probabilities: Model predictions, shape (n_tasks, n_classes)
+            top_k: Only return the k most uncertain tasks
+            columnar: Return a lazy RankedTasks instead of a list of dicts
         
         Returns:
             ranked_tasks: Sorted by descending entropy
         """
-        texts = [t['text'] for t in tasks]
-        
+        probabilities = np.asarray(probabilities, dtype=float)
         # Calculate entropy
         entropy = self.calculate_entropy(probabilities)
-        costs = self.calculate_costs(texts)  # Still calculate for transparency
         
         # Sort by descending entropy (no cost division)
-        sorted_indices = np.argsort(entropy)[::-1]
+        candidates = np.flatnonzero(entropy > 0)
+        order = candidates[top_k_indices(entropy[candidates], top_k)]
+        
+        # Cost is only for transparency: compute it for the returned tasks only
+        costs = self.calculate_costs([tasks[i]['text'] for i in order])
+        
+        probs = probabilities[order]
+        k = len(order)
+        ranked = RankedTasks(
+            tasks, order,
+            scores=entropy[order],  # Pure entropy score
+            label_index=np.argmax(probs, axis=1),
+            confidence=np.max(probs, axis=1),
+            costs=costs,
+            entropy=entropy[order],
+            penalties=np.ones(k),
+            cal_log_scores=np.zeros(k),  # Not used
+            phase="Entropy-Only Active",
+            context_penalty="Ignored"
+        )
+        return ranked if columnar else ranked.to_list()
+    
+    def rank_streaming(
+        self,
+        task_chunks: Iterable[List[Dict[str, Any]]],
+        proba_fn: Callable[[List[str]], np.ndarray],
+        top_k: int = 50,
+        strategy: str = "cal_log",
+        columnar: bool = False
+    ) -> Union[List[Dict[str, Any]], RankedTasks]:
+        """
+        Rank a pool too large for memory, one chunk at a time.
+        Keeps only a bounded global top-k; output is identical to the batch path
+        (rank_by_cal_log / rank_by_entropy_only with the same top_k).
+        
+        Args:
+            task_chunks: Iterator of task-dict lists (e.g. iter_task_chunks(path))
+            proba_fn: texts -> probabilities, e.g. StandardBackbone.predict_proba
+            top_k: Number of tasks to return
+            strategy: "cal_log" (entropy / cost) or "entropy"
+            columnar: Return a lazy RankedTasks instead of a list of dicts
         
-        ranked_tasks = []
-        for idx in sorted_indices:
-            if entropy[idx] <= 0:
+        Returns:
+            ranked_tasks: Best top_k tasks across all chunks, sorted by descending score
+        """
+        def chunks():
+            for chunk in task_chunks:
+                if not chunk:
+                    continue
+                texts = [t['text'] for t in chunk]
+                yield (
+                    proba_fn(texts),
+                    lambda idx, texts=texts: self.calculate_costs([texts[i] for i in idx]),
+                    lambda idx, chunk=chunk: [chunk[i] for i in idx],
+                )
+        
+        return self._rank_chunks(chunks(), top_k, strategy, columnar)
+    
+    def rank_pool_streaming(
+        self,
+        pool,
+        proba_fn: Callable[[np.ndarray], np.ndarray],
+        top_k: int = 50,
+        strategy: str = "cal_log",
+        columnar: bool = False,
+        chunk_size: int = 65536
+    ) -> Union[List[Dict[str, Any]], RankedTasks]:
+        """
+        rank_streaming over a PoolStore: probabilities come from the stored embeddings and
+        costs from the stored word counts, so no text is read and nothing is re-embedded.
+        The pool keeps no text, so ranked tasks carry an empty 'text'.
+        
+        Args:
+            pool: PoolStore with the live tasks
+            proba_fn: embeddings -> probabilities, e.g. StandardBackbone.classify_embeddings
+            top_k: Number of tasks to return
+            strategy: "cal_log" (entropy / cost) or "entropy"
+            columnar: Return a lazy RankedTasks instead of a list of dicts
+            chunk_size: Pool rows scored per chunk
+        
+        Returns:
+            ranked_tasks: Best top_k live tasks, sorted by descending score
+        """
+        def chunks():
+            for _, task_ids, X, lengths in pool.iter_chunks(chunk_size):
+                yield (
+                    proba_fn(X),
+                    lambda idx, lengths=lengths: self.cost_model.predict(lengths[idx]),
+                    lambda idx, task_ids=task_ids: [{'taskId': int(task_ids[i]), 'text': ''} for i in idx],
+                )
+        
+        return self._rank_chunks(chunks(), top_k, strategy, columnar)
+    
+    def _rank_chunks(self, chunks, top_k, strategy, columnar):
+        """
+        Shared top-k merge of rank_streaming / rank_pool_streaming.
+        `chunks` yields (probabilities, costs_fn, tasks_fn); both functions take
+        chunk-local indices, so entropy-only ranking prices and builds the winners only.
+        """
+        if strategy not in ("cal_log", "entropy"):
+            raise ValueError(f"Unknown strategy '{strategy}'")
+        
+        # Running top-k columns (global position breaks ties, like the stable batch sort)
+        best_tasks = []
+        best = {name: np.zeros(0) for name in ("pos", "score", "label", "conf", "cost", "entropy")}
+        offset = 0
+        
+        for probabilities, costs_fn, tasks_fn in chunks:
+            probabilities = np.asarray(probabilities, dtype=float)
+            n = len(probabilities)
+            if n == 0:
                 continue
+            entropy = self.calculate_entropy(probabilities)
+            if strategy == "cal_log":
+                costs = np.asarray(costs_fn(np.arange(n)), dtype=np.float64)
+                scores = entropy / costs
+            else:
+                costs = None  # priced for the winners only
+                scores = entropy
             
-            task_resp = {
-                "id": tasks[idx]['taskId'],
-                "text": tasks[idx]['text'],
-                "score": float(entropy[idx]),  # Pure entropy score
-                "prediction": {
-                    "label_index": int(np.argmax(probabilities[idx])),
-                    "confidence": float(np.max(probabilities[idx]))
-                },
-                "transparency_report": {
-                    "phase": "Entropy-Only Active",
-                    "cost_analysis": {
-                        "predicted_seconds": float(costs[idx]),
-                        "context_penalty": "Ignored"
-                    },
-                    "math_proof": {
-                        "entropy": float(entropy[idx]),
-                        "redundancy_penalty": 1.0,
-                        "cal_log_score": 0.0  # Not used
-                    }
-                }
+            candidates = np.flatnonzero(scores > 0)
+            local = candidates[top_k_indices(scores[candidates], top_k)]
+            probs = probabilities[local]
+            local_costs = costs[local] if costs is not None else np.asarray(costs_fn(local), dtype=np.float64)
+            
+            merged_tasks = best_tasks + tasks_fn(local)
+            merged = {
+                "pos": np.concatenate([best["pos"], local + offset]),
+                "score": np.concatenate([best["score"], scores[local]]),
+                "label": np.concatenate([best["label"], np.argmax(probs, axis=1)]),
+                "conf": np.concatenate([best["conf"], np.max(probs, axis=1)]),
+                "cost": np.concatenate([best["cost"], local_costs]),
+                "entropy": np.concatenate([best["entropy"], entropy[local]]),
             }
-            ranked_tasks.append(task_resp)
+            keep = np.lexsort((merged["pos"], -merged["score"]))[:top_k]
+            best_tasks = [merged_tasks[i] for i in keep]
+            best = {name: col[keep] for name, col in merged.items()}
+            offset += n
         
-        return ranked_tasks
-
+        k = len(best_tasks)
+        cal_log = strategy == "cal_log"
+        ranked = RankedTasks(
+            best_tasks, np.arange(k),
+            scores=best["score"],
+            label_index=best["label"],
+            confidence=best["conf"],
+            costs=best["cost"],
+            entropy=best["entropy"],
+            penalties=np.ones(k),
+            cal_log_scores=best["score"] if cal_log else np.zeros(k),  # Not used for entropy-only
+            phase="CAL-Log Active" if cal_log else "Entropy-Only Active",
+            context_penalty="Adaptive" if cal_log else "Ignored"
+        )
+        return ranked if columnar else ranked.to_list()
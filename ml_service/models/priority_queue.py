@@ -0,0 +1,362 @@
+"""
+Backend-side CAL-Log priority queue over the unlabeled pool.
+An indexed max-heap per annotator answers "next best tasks" in O(k log k), while
+scores are kept current incrementally: entropy is re-scored in vectorized chunks when
+the classifier changes, one annotator's heap is re-keyed when their cost parameters
+change, and labeled tasks leave every heap in O(log n).
+"""
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+EPSILON = 1e-10
+
+
+class IndexedMaxHeap:
+    """
+    Binary max-heap of (key, item) with an item -> position index, so any item's key
+    can be increased, decreased or removed in O(log n).
+    Ties are broken by insertion order of the bulk load (earlier first).
+    """
+
+    def __init__(self):
+        self._keys: List[float] = []
+        self._items: List[int] = []
+        self._pos: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def key(self, item) -> Optional[float]:
+        pos = self._pos.get(item)
+        return None if pos is None else self._keys[pos]
+
+    # ------------------------------------------------------------------
+    def _swap(self, i, j):
+        keys, items, pos = self._keys, self._items, self._pos
+        keys[i], keys[j] = keys[j], keys[i]
+        items[i], items[j] = items[j], items[i]
+        pos[items[i]] = i
+        pos[items[j]] = j
+
+    def _sift_up(self, i):
+        keys = self._keys
+        while i > 0:
+            parent = (i - 1) >> 1
+            if keys[i] <= keys[parent]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        keys, n = self._keys, len(self._keys)
+        while True:
+            left = 2 * i + 1
+            if left >= n:
+                break
+            child = left
+            if left + 1 < n and keys[left + 1] > keys[left]:
+                child = left + 1
+            if keys[child] <= keys[i]:
+                break
+            self._swap(i, child)
+            i = child
+
+    # ------------------------------------------------------------------
+    def load(self, items, keys):
+        """Replace the contents in O(n log n) inside NumPy (a sorted array is a valid heap)."""
+        items = np.asarray(items, dtype=np.int64)
+        keys = np.asarray(keys, dtype=np.float64)
+        order = np.argsort(-keys, kind="stable")
+        self._keys = keys[order].tolist()
+        self._items = items[order].tolist()
+        self._pos = {item: i for i, item in enumerate(self._items)}
+
+    def update(self, item, key):
+        """Insert `item`, or move it to `key` (increase- or decrease-key)."""
+        key = float(key)
+        pos = self._pos.get(item)
+        if pos is None:
+            self._keys.append(key)
+            self._items.append(item)
+            self._pos[item] = len(self._items) - 1
+            self._sift_up(len(self._items) - 1)
+            return
+        old = self._keys[pos]
+        self._keys[pos] = key
+        if key > old:
+            self._sift_up(pos)
+        elif key < old:
+            self._sift_down(pos)
+
+    def update_many(self, items, keys, rebuild_fraction=0.25):
+        """
+        Apply many key updates. Past `rebuild_fraction` of the heap, one bulk reload
+        is cheaper than per-item sifts.
+        """
+        items = np.asarray(items, dtype=np.int64)
+        keys = np.asarray(keys, dtype=np.float64)
+        if len(items) > rebuild_fraction * max(1, len(self)):
+            merged = dict(zip(self._items, self._keys))
+            merged.update(zip(items.tolist(), keys.tolist()))
+            self.load(np.fromiter(merged.keys(), dtype=np.int64, count=len(merged)),
+                      np.fromiter(merged.values(), dtype=np.float64, count=len(merged)))
+            return
+        for item, key in zip(items.tolist(), keys.tolist()):
+            self.update(item, key)
+
+    def remove(self, item) -> bool:
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return False
+        last = len(self._items) - 1
+        if pos != last:
+            self._keys[pos] = self._keys[last]
+            self._items[pos] = self._items[last]
+            self._pos[self._items[pos]] = pos
+        self._keys.pop()
+        self._items.pop()
+        if pos < len(self._items):
+            self._sift_up(pos)
+            self._sift_down(pos)
+        return True
+
+    def top_k(self, k) -> List[Tuple[int, float]]:
+        """Best k (item, key) pairs, best first, without modifying the heap: O(k log k)."""
+        keys, items, n = self._keys, self._items, len(self._items)
+        out = []
+        if n == 0 or k <= 0:
+            return out
+        frontier = [(-keys[0], 0)]
+        while frontier and len(out) < k:
+            neg_key, i = heapq.heappop(frontier)
+            out.append((items[i], -neg_key))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n:
+                    heapq.heappush(frontier, (-keys[child], child))
+        return out
+
+
+class PoolPriorityQueue:
+    """
+    Per-annotator CAL-Log ordering of the live pool.
+
+    Cost-independent columns (entropy, log length) are stored once per task; each
+    annotator's heap keys tasks by entropy / (alpha + beta * log_length).
+
+    Usage:
+        queue = PoolPriorityQueue()
+        queue.refresh(pool, backbone.classify_embeddings)   # after a classifier update
+        queue.top(user_id, alpha, beta, k=10)               # [(task_id, score), ...]
+        queue.remove(labeled_ids)
+    """
+
+    def __init__(self, max_users: int = 64, chunk_size: int = 65536):
+        self.max_users = int(max_users)
+        self.chunk_size = int(chunk_size)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # one rebuild at a time
+        self._changes = None  # while a rebuild runs: [("add", ids, entropy, log_len) | ("remove", ids)]
+        self._slot: Dict[int, int] = {}  # task id -> row in the column arrays
+        self._task_ids = np.zeros(0, dtype=np.int64)
+        self._entropy = np.zeros(0, dtype=np.float64)
+        self._log_len = np.zeros(0, dtype=np.float64)
+        self._live = np.zeros(0, dtype=bool)
+        self._heaps: "OrderedDict[str, Tuple[float, float, IndexedMaxHeap]]" = OrderedDict()
+        self._pending: List[int] = []  # ids added to the pool since the last scoring pass
+        self.model_version = None
+        self.refreshes = 0
+
+    def __len__(self):
+        return int(self._live.sum())
+
+    # ------------------------------------------------------------------
+    # Columns
+    # ------------------------------------------------------------------
+    def _ensure_slots(self, task_ids):
+        new = [tid for tid in task_ids.tolist() if tid not in self._slot]
+        if new:
+            start = len(self._task_ids)
+            for offset, tid in enumerate(new):
+                self._slot[tid] = start + offset
+            extra = len(new)
+            self._task_ids = np.concatenate([self._task_ids, np.asarray(new, dtype=np.int64)])
+            self._entropy = np.concatenate([self._entropy, np.zeros(extra)])
+            self._log_len = np.concatenate([self._log_len, np.zeros(extra)])
+            self._live = np.concatenate([self._live, np.zeros(extra, dtype=bool)])
+        return np.fromiter((self._slot[tid] for tid in task_ids.tolist()), dtype=np.int64, count=len(task_ids))
+
+    @staticmethod
+    def _scores(entropy, log_len, alpha, beta):
+        return entropy / (alpha + beta * log_len + 1e-6)
+
+    def _store(self, task_ids, entropy, log_len):
+        if self._changes is not None:
+            self._changes.append(("add", task_ids, entropy, log_len))
+        slots = self._ensure_slots(task_ids)
+        self._entropy[slots] = entropy
+        self._log_len[slots] = log_len
+        self._live[slots] = True
+        return slots
+
+    def _rekey(self, task_ids, slots):
+        for alpha, beta, heap in self._heaps.values():
+            heap.update_many(task_ids, self._scores(self._entropy[slots], self._log_len[slots], alpha, beta))
+
+    @staticmethod
+    def _entropy_of(proba_fn, X):
+        probs = proba_fn(X)
+        return -np.sum(probs * np.log(probs + EPSILON), axis=1)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def refresh(self, pool, proba_fn, model_version=None):
+        """
+        Re-score every live pool task in vectorized chunks (after a classifier update).
+        The columns and every tracked annotator's heap are rebuilt off to the side and
+        swapped in, so top() keeps answering from the current heaps meanwhile; adds and
+        removals that land during the rebuild are replayed onto the new heaps.
+        Tasks no longer live in the pool are dropped.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                params = {user_id: (alpha, beta) for user_id, (alpha, beta, _) in self._heaps.items()}
+                self._changes = []
+            try:
+                ids, entropy, log_len = [], [], []
+                for _, chunk_ids, X, lengths in pool.iter_chunks(self.chunk_size):
+                    ids.append(chunk_ids)
+                    entropy.append(self._entropy_of(proba_fn, X))
+                    log_len.append(np.log1p(lengths.astype(np.float64)))
+                ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+                entropy = np.concatenate(entropy) if entropy else np.zeros(0)
+                log_len = np.concatenate(log_len) if log_len else np.zeros(0)
+                # Tasks labeled while we were scoring stay out
+                live = pool.contains(ids)
+                ids, entropy, log_len = ids[live], entropy[live], log_len[live]
+                slot = dict(zip(ids.tolist(), range(len(ids))))
+                heaps = {}
+                for user_id, (alpha, beta) in params.items():
+                    heap = IndexedMaxHeap()
+                    heap.load(ids, self._scores(entropy, log_len, alpha, beta))
+                    heaps[user_id] = (alpha, beta, heap)
+            except Exception:
+                with self._lock:
+                    self._changes = None
+                raise
+
+            with self._lock:
+                changes, self._changes = self._changes, None
+                # Freed after the lock is released: dropping 100k-entry containers is not free
+                retired = [self._slot] + [entry[2] for entry in self._heaps.values()]
+                self._slot = slot
+                self._task_ids = ids
+                self._entropy = entropy
+                self._log_len = log_len
+                self._live = np.ones(len(ids), dtype=bool)
+                # Heaps whose parameters moved (or that appeared) meanwhile are rebuilt on their next query
+                self._heaps = OrderedDict(
+                    (user_id, heaps[user_id]) for user_id, entry in self._heaps.items()
+                    if user_id in heaps and heaps[user_id][:2] == entry[:2]
+                )
+                for change in changes:
+                    if change[0] == "add":
+                        _, task_ids, e, l = change
+                        self._rekey(task_ids, self._store(task_ids, e, l))
+                    else:
+                        self._remove_locked(change[1])
+                self.model_version = model_version
+                self.refreshes += 1
+            self._release(retired)
+
+    @staticmethod
+    def _release(retired):
+        """Free retired indexes one container at a time, so top() gets the GIL in between."""
+        while retired:
+            obj = retired.pop()
+            if isinstance(obj, IndexedMaxHeap):
+                obj._pos = None
+                obj._items = None
+                obj._keys = None
+            del obj
+
+    def add_pending(self, task_ids):
+        """Tasks just added to the pool; scored on the next score_pending/refresh."""
+        with self._lock:
+            self._pending.extend(int(t) for t in task_ids)
+
+    def score_pending(self, pool, proba_fn):
+        """Score tasks added since the last pass (small, vectorized)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        ids = np.asarray(pending, dtype=np.int64)
+        rows = pool.rows_for(ids)
+        ids = ids[rows >= 0]
+        if len(ids) == 0:
+            return 0
+        entropy = self._entropy_of(proba_fn, pool.embeddings_for(ids))
+        log_len = np.log1p(pool.lengths_for(ids).astype(np.float64))
+        with self._lock:
+            self._rekey(ids, self._store(ids, entropy, log_len))
+        return len(ids)
+
+    def _remove_locked(self, task_ids):
+        if self._changes is not None:
+            self._changes.append(("remove", task_ids))
+        removed = 0
+        for tid in np.asarray(task_ids, dtype=np.int64).tolist():
+            slot = self._slot.get(tid)
+            if slot is None or not self._live[slot]:
+                continue
+            self._live[slot] = False
+            for _, _, heap in self._heaps.values():
+                heap.remove(tid)
+            removed += 1
+        return removed
+
+    def remove(self, task_ids):
+        """Labeled/deleted tasks leave every heap in O(log n) each."""
+        with self._lock:
+            return self._remove_locked(task_ids)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _heap_for(self, user_id, alpha, beta):
+        entry = self._heaps.get(user_id)
+        if entry is not None and entry[0] == alpha and entry[1] == beta:
+            self._heaps.move_to_end(user_id)
+            return entry[2]
+        heap = entry[2] if entry is not None else IndexedMaxHeap()
+        live = np.flatnonzero(self._live)
+        scores = self._scores(self._entropy[live], self._log_len[live], alpha, beta)
+        if entry is None:
+            heap.load(self._task_ids[live], scores)
+        else:
+            # Cost parameters moved: re-key (bulk reload if most keys change, which they do)
+            heap.update_many(self._task_ids[live], scores)
+        self._heaps[user_id] = (alpha, beta, heap)
+        self._heaps.move_to_end(user_id)
+        while len(self._heaps) > self.max_users:
+            self._heaps.popitem(last=False)
+        return heap
+
+    def set_params(self, user_id, alpha, beta):
+        """Re-key one annotator's heap for new cost parameters (no-op if not tracked)."""
+        with self._lock:
+            if user_id in self._heaps:
+                self._heap_for(user_id, float(alpha), float(beta))
+
+    def top(self, user_id, alpha, beta, k=10) -> List[Tuple[int, float]]:
+        """Best k (task_id, score) for this annotator's cost parameters."""
+        with self._lock:
+            return self._heap_for(user_id, float(alpha), float(beta)).top_k(int(k))
@@ -0,0 +1,201 @@
+"""
+Redundancy penalties for CAL-Log ranking.
+Penalizes tasks that are near-duplicates of already-labeled tasks or of tasks
+ranked above them in the same request, so annotators are not served clusters
+of near-identical stories.
+
+Penalties feed CALLogRanker.rank_by_cal_log(penalties=...): 1.0 = no penalty.
+"""
+import heapq
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.clip(norms, 1e-12, None)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbor index (pure NumPy, CPU only).
+
+    Vectors are bucketed by their nearest k-means centroid; a query only scans the
+    `nprobe` closest buckets, so cost grows ~ n * nprobe / nlist instead of n.
+    Below `train_threshold` vectors the index stays exact (flat scan).
+    The centroids are retrained whenever the index doubles in size.
+    """
+
+    def __init__(self, dim: int, nprobe: int = 8, train_threshold: int = 2048, kmeans_iters: int = 10,
+                 seed: int = 42):
+        self.dim = int(dim)
+        self.nprobe = int(nprobe)
+        self.train_threshold = int(train_threshold)
+        self.kmeans_iters = int(kmeans_iters)
+        self._rng = np.random.default_rng(seed)
+
+        self.centroids: Optional[np.ndarray] = None
+        self._lists = []          # per-centroid float16 arrays
+        self._flat = np.zeros((0, self.dim), dtype=np.float16)
+        self._size = 0
+        self._retrain_at = self.train_threshold
+
+    def __len__(self):
+        return self._size
+
+    def _all_vectors(self) -> np.ndarray:
+        if self.centroids is None:
+            return self._flat
+        return np.vstack([self._flat] + self._lists)
+
+    def _kmeans(self, data: np.ndarray, k: int) -> np.ndarray:
+        centroids = data[self._rng.choice(len(data), size=k, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            counts = np.bincount(assign, minlength=k)
+            empty = counts == 0
+            sums[empty] = centroids[empty]  # keep empty centroids where they were
+            centroids = _normalize(sums)
+        return centroids
+
+    def _train(self):
+        data = self._all_vectors().astype(np.float32)
+        nlist = max(1, int(np.sqrt(len(data))))
+        sample = data if len(data) <= 50 * nlist else data[self._rng.choice(len(data), 50 * nlist, replace=False)]
+        self.centroids = self._kmeans(sample, nlist)
+        assign = np.argmax(data @ self.centroids.T, axis=1)
+        self._lists = [data[assign == c].astype(np.float16) for c in range(nlist)]
+        self._flat = np.zeros((0, self.dim), dtype=np.float16)
+        self._retrain_at = 2 * len(data)
+
+    def add(self, vectors: np.ndarray):
+        """Add (already normalized) vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        if self.centroids is None:
+            self._flat = np.vstack([self._flat, vectors.astype(np.float16)])
+        else:
+            assign = np.argmax(vectors @ self.centroids.T, axis=1)
+            for c in np.unique(assign):
+                self._lists[c] = np.vstack([self._lists[c], vectors[assign == c].astype(np.float16)])
+        self._size += len(vectors)
+        if self._size >= self._retrain_at:
+            self._train()
+
+    def max_similarity(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate max cosine similarity of each (normalized) query to the index. 0 if empty."""
+        queries = np.asarray(queries, dtype=np.float32)
+        best = np.zeros(len(queries), dtype=np.float32)
+        if self._size == 0 or len(queries) == 0:
+            return best
+        if self.centroids is None:
+            return np.maximum(best, (queries @ self._flat.T.astype(np.float32)).max(axis=1))
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        # Scan each probed bucket once, for all queries probing it
+        for c in np.unique(probes):
+            bucket = self._lists[c]
+            if len(bucket) == 0:
+                continue
+            q_idx = np.flatnonzero((probes == c).any(axis=1))
+            sims = (queries[q_idx] @ bucket.T.astype(np.float32)).max(axis=1)
+            best[q_idx] = np.maximum(best[q_idx], sims)
+        return best
+
+
+class RedundancyEngine:
+    """
+    Computes multiplicative redundancy penalties from backbone embeddings.
+
+    penalty(sim) = 1                                  if sim <= threshold
+                 = (1 - sim) / (1 - threshold)        otherwise (floored at min_penalty)
+
+    Two sources of similarity:
+    - to already-labeled tasks (IVF index, updated incrementally via add_labeled)
+    - to tasks ranked above in the same request (lazy greedy over the top `max_selected`)
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.7, min_penalty: float = 0.01, max_selected: int = 50,
+                 nprobe: int = 8):
+        self.dim = int(dim)
+        self.threshold = float(threshold)
+        self.min_penalty = float(min_penalty)
+        self.max_selected = int(max_selected)
+        self.index = IVFIndex(dim, nprobe=nprobe)
+        self._labeled_ids = set()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """Changes whenever the labeled set grows (penalties computed earlier are stale)."""
+        return len(self.index)
+
+    def penalty(self, similarity: np.ndarray) -> np.ndarray:
+        similarity = np.asarray(similarity, dtype=np.float32)
+        scaled = (1.0 - similarity) / (1.0 - self.threshold)
+        return np.clip(scaled, self.min_penalty, 1.0)
+
+    def add_labeled(self, task_ids, embeddings: np.ndarray):
+        """Register labeled tasks (ids already known are ignored)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            keep = []
+            for i, tid in enumerate(task_ids):
+                if tid is None or tid not in self._labeled_ids:
+                    keep.append(i)
+                    if tid is not None:
+                        self._labeled_ids.add(tid)
+            if keep:
+                self.index.add(_normalize(embeddings[keep]))
+
+    def penalties(self, embeddings: np.ndarray, base_scores: np.ndarray) -> np.ndarray:
+        """
+        Penalties for one ranking request.
+
+        Args:
+            embeddings: Candidate embeddings, shape (n_tasks, dim)
+            base_scores: Unpenalized CAL-Log scores, shape (n_tasks,)
+
+        Returns:
+            penalties: Shape (n_tasks,) in [min_penalty, 1]
+        """
+        n = len(base_scores)
+        if n == 0:
+            return np.ones(0)
+        X = _normalize(embeddings)
+        with self._lock:
+            labeled_pen = self.penalty(self.index.max_similarity(X))
+        scores = np.asarray(base_scores, dtype=np.float64) * labeled_pen
+
+        # Lazy greedy: pop the best candidate, re-penalize against the selected set,
+        # accept if it is still at least as good as the next best
+        heap = [(-s, i) for i, s in enumerate(scores)]
+        heapq.heapify(heap)
+        selected = []
+        selected_pen = np.ones(n)
+        evaluated_at = np.full(n, -1)
+        while heap and len(selected) < min(self.max_selected, n):
+            neg, i = heapq.heappop(heap)
+            if evaluated_at[i] == len(selected):
+                selected.append(i)
+                continue
+            if selected:
+                sim = float(np.max(X[selected] @ X[i]))
+                selected_pen[i] = self.penalty(sim)
+            evaluated_at[i] = len(selected)
+            heapq.heappush(heap, (-scores[i] * selected_pen[i], i))
+
+        # Everything not picked greedily: one GEMM against the selected set
+        if selected and len(selected) < n:
+            rest = np.setdiff1d(np.arange(n), selected)
+            sims = (X[rest] @ X[selected].T).max(axis=1)
+            selected_pen[rest] = self.penalty(sims)
+
+        return labeled_pen * selected_pen
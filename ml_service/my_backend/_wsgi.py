@@ -1,10 +1,15 @@
 # PROVENANCE: Auto-generated by label-studio-ml init https://github.com/HumanSignal/label-studio-ml-backend
 
 import os
+import math
 import argparse
 import json
 import logging
 import logging.config
+import struct
+import time
+
+import numpy as np
 
 logging.config.dictConfig({
   "version": 1,
@@ -31,8 +36,13 @@ logging.config.dictConfig({
 })
 
 from label_studio_ml.api import init_app
-from label_studio_adapter import CALLogBackend
-from flask import request, jsonify
+from label_studio_adapter import CALLogBackend, backbone_loader, prediction_cache, training_events, task_queue, next_tasks
+from metrics import REGISTRY
+from flask import request, jsonify, Response, stream_with_context
+
+# An SSE client holds a (sync) worker for as long as it is connected; EventSource
+# reconnects with Last-Event-ID after the server closes the stream
+SPY_STREAM_MAX_SECONDS = float(os.environ.get("SPY_STREAM_MAX_SECONDS", 300))
 
 
 _DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.json')
@@ -47,6 +57,209 @@ def get_kwargs_from_config(config_path=_DEFAULT_CONFIG_PATH):
     return config
 
 
+def health():
+    """Liveness + model readiness (loading / ready / failed)."""
+    status = backbone_loader.status()
+    failed = status['state'] == backbone_loader.FAILED
+    body = {
+        'status': 'DOWN' if failed else 'UP',
+        'ready': backbone_loader.is_ready,
+        'model_state': status['state'],
+        'model_error': status['error'],
+        'model_load_seconds': status['load_seconds'],
+        'prediction_cache': prediction_cache.stats(),
+    }
+    return jsonify(body), (503 if failed else 200)
+
+
+def metrics():
+    """Prometheus text exposition of this worker's latency histograms, batch sizes, caches and queue."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Binary /embed body: 16-byte header, then row-major little-endian values
+#   magic b"EMBD" | version u8 | dtype u8 (1 = float16, 2 = float32) | reserved u16 | rows u32 | dim u32
+EMBED_HEADER = struct.Struct('<4sBBHII')
+EMBED_DTYPES = {'float16': (1, np.dtype('<f2')), 'float32': (2, np.dtype('<f4'))}
+EMBED_MAX_TEXTS = int(os.environ.get('EMBED_MAX_TEXTS', 200000))
+
+
+def _embed_format(payload):
+    """Response format from the body's "format" field, else the Accept header."""
+    fmt = payload.get('format')
+    if fmt:
+        return fmt
+    accept = request.headers.get('Accept', '')
+    if 'application/octet-stream' in accept:
+        return 'binary'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return 'json'
+
+
+def embed():
+    """
+    POST /embed {"texts": [...], "format": "json" | "ndjson" | "binary", "dtype": "float16" | "float32"}
+    Embeddings from StandardBackbone.embed (cache-aware, chunked for large batches).
+    - json:   {"model", "dim", "count", "embeddings": [[...], ...]}
+    - ndjson: one {"start", "embeddings"} line per chunk, streamed as chunks finish
+    - binary: EMBED_HEADER + raw little-endian values (also in X-Embedding-Shape / X-Embedding-Dtype)
+    The format may also be negotiated via Accept (application/x-ndjson, application/octet-stream).
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    texts = payload.get('texts')
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': '"texts" must be a list of strings'}), 400
+    if len(texts) > EMBED_MAX_TEXTS:
+        return jsonify({'error': f'at most {EMBED_MAX_TEXTS} texts per request'}), 413
+    fmt = _embed_format(payload)
+    dtype_name = payload.get('dtype', 'float16' if fmt == 'binary' else 'float32')
+    if fmt not in ('json', 'ndjson', 'binary') or dtype_name not in EMBED_DTYPES:
+        return jsonify({'error': f'unsupported format/dtype: {fmt}/{dtype_name}'}), 400
+
+    backbone = backbone_loader.wait(timeout=float(os.environ.get('EMBED_READY_TIMEOUT', 30)))
+    if backbone is None:
+        return jsonify({'error': f'model not ready ({backbone_loader.state})'}), 503
+    dim = backbone.embedding_dim
+
+    if fmt == 'json':
+        return jsonify({
+            'model': backbone.model_name,
+            'dim': dim,
+            'count': len(texts),
+            'embeddings': backbone.embed(texts).tolist() if texts else [],
+        })
+
+    if fmt == 'ndjson':
+        def lines():
+            for start, X in backbone.iter_embeddings(texts):
+                yield json.dumps({'start': start, 'embeddings': X.tolist()}) + '\n'
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+    code, dtype = EMBED_DTYPES[dtype_name]
+
+    def chunks():
+        yield EMBED_HEADER.pack(b'EMBD', 1, code, 0, len(texts), dim)
+        for _, X in backbone.iter_embeddings(texts):
+            yield np.ascontiguousarray(X, dtype=dtype).tobytes()
+
+    response = Response(stream_with_context(chunks()), mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(EMBED_HEADER.size + len(texts) * dim * dtype.itemsize)
+    response.headers['X-Embedding-Shape'] = f'{len(texts)},{dim}'
+    response.headers['X-Embedding-Dtype'] = dtype_name
+    return response
+
+
+NEXT_MAX_K = int(os.environ.get('NEXT_MAX_K', 1000))
+
+
+def next_best():
+    """
+    GET /next?user=<annotator id>&k=<n>
+    Best k unlabeled pool tasks for this annotator (CAL-Log utility), best first,
+    from the backend's incrementally maintained priority queue.
+    """
+    try:
+        k = max(1, min(int(request.args.get('k', 10)), NEXT_MAX_K))
+    except ValueError:
+        return jsonify({'error': '"k" must be an integer'}), 400
+    user_id = request.args.get('user')
+    ranked = next_tasks(user_id, k)
+    if ranked is None:
+        state = 'scoring pool' if backbone_loader.is_ready else backbone_loader.state
+        return jsonify({'error': f'model not ready ({state})'}), 503
+    return jsonify({
+        'user': user_id,
+        'model_version': task_queue.model_version,
+        'queue_size': len(task_queue),
+        'tasks': [{'id': int(task_id), 'score': float(score)} for task_id, score in ranked],
+    })
+
+
+def _since():
+    """Sequence number the client already has (?since=, or Last-Event-ID on SSE reconnect)."""
+    value = request.args.get('since') or request.headers.get('Last-Event-ID') or 0
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def spy_metrics():
+    """
+    Long-poll training metrics for the Spy Window.
+    GET /spy/metrics?since=<seq>&timeout=<seconds>: returns as soon as there are records
+    newer than `since` (or after `timeout`, with an empty list).
+    Records come from the ring of the worker serving the request (its own training batches).
+    """
+    message = '"timeout" must be a number of seconds'
+    try:
+        timeout = float(request.args.get('timeout', 25))
+    except ValueError:
+        return jsonify({'error': message}), 400
+    if not math.isfinite(timeout):
+        return jsonify({'error': message}), 400
+    timeout = min(max(timeout, 0.0), 60.0)
+    records = training_events.wait(_since(), timeout=timeout)
+    response = jsonify({'records': records, 'last_seq': training_events.last_seq})
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+def spy_stream():
+    """
+    Server-Sent Events stream of training metrics (one `data:` JSON event per record).
+    Like /spy/metrics it only sees the serving worker's ring. The stream ends after
+    SPY_STREAM_MAX_SECONDS so a client cannot hold a worker indefinitely; the browser
+    reconnects and resumes from Last-Event-ID.
+    """
+    since = _since()
+
+    def events():
+        last = since
+        deadline = time.monotonic() + SPY_STREAM_MAX_SECONDS
+        yield 'retry: 1000\n\n'
+        # Immediately replay what the ring still holds, then block for new records
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            records = training_events.wait(last, timeout=min(15.0, remaining))
+            if not records:
+                yield ': keep-alive\n\n'
+                continue
+            for record in records:
+                last = record['seq']
+                yield f"id: {last}\ndata: {json.dumps(record)}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+def _set_route(app, path, view, methods=('GET',)):
+    """Serve `path` with `view`, replacing the stock label-studio-ml handler if there is one."""
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.rule == path}
+    if endpoints:
+        for endpoint in endpoints:
+            app.view_functions[endpoint] = view
+    else:
+        app.add_url_rule(path, view.__name__, view, methods=list(methods))
+
+
+def register_routes(app):
+    """Attach CAL-Log routes to the label-studio-ml Flask app."""
+    _set_route(app, '/health', health)
+    _set_route(app, '/metrics', metrics)
+    _set_route(app, '/spy/metrics', spy_metrics)
+    _set_route(app, '/spy/stream', spy_stream)
+    _set_route(app, '/embed', embed, methods=('POST',))
+    _set_route(app, '/next', next_best)
+    return app
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Label studio')
     parser.add_argument(
@@ -116,6 +329,8 @@ if __name__ == "__main__":
         redis_port=os.environ.get('REDIS_PORT', 6379),
         **kwargs
     )
+    register_routes(app)
+    backbone_loader.start()
 
     app.run(host=args.host, port=args.port, debug=args.debug)
 
@@ -128,3 +343,7 @@ else:
         redis_host=os.environ.get('REDIS_HOST', 'localhost'),
         redis_port=os.environ.get('REDIS_PORT', 6379)
     )
+    register_routes(app)
+    # Start warming the embedder now; /health reports progress.
+    # NOTE: with uWSGI, use lazy-apps so this runs in each worker, not the master.
+    backbone_loader.start()
@@ -1,6 +1,9 @@
 import os
 import sys
+import time
+import atexit
 import logging
+import threading
 import numpy as np
 import requests
 
@@ -10,8 +13,15 @@ if os.path.basename(os.path.dirname(__file__)) == 'my_backend':
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from label_studio_ml.model import LabelStudioMLBase
-from cost_engine import AdaptiveCostModel
-from backbone import StandardBackbone
+from cost_engine import AdaptiveCostModel, stack_cost_params, predict_cost_matrix
+from score_cache import UserScoreCache, PredictionCache
+from embedding_cache import text_key
+from interaction_log import InteractionLog
+from training_queue import TrainingQueue
+from state_store import StateStore
+from metrics import REGISTRY, REQUESTS, STAGE_SECONDS, MetricsRing, timer, observe_batch
+from models.priority_queue import PoolPriorityQueue
+# NOTE: backbone (sklearn + transformer engines) is imported lazily by BackboneLoader
 # from models import CALLogRanker (Logic inlined into adapter)
 
 # Configure logging
@@ -23,15 +33,387 @@ logger.setLevel(logging.INFO)
 import random
 random.seed(42)
 np.random.seed(42)
-try:
-    import torch
-    torch.manual_seed(42)
-    if torch.cuda.is_available():
-        torch.cuda.manual_seed_all(42)
-except ImportError:
-    pass # Torch might be inside sentence-transformers only
+
+
+def _seed_torch():
+    # Deferred until the backbone loads, so importing this module stays cheap
+    try:
+        import torch
+        torch.manual_seed(42)
+        if torch.cuda.is_available():
+            torch.cuda.manual_seed_all(42)
+    except ImportError:
+        pass # Torch might be inside sentence-transformers only
 # --------------------------------------------
 
+
+# Classifier checkpoint written by the trainer; preferred over the pre-trained model on startup
+CHECKPOINT_PATH = os.environ.get("MODEL_CHECKPOINT_PATH", os.path.join(os.path.dirname(__file__), "checkpoint.pkl"))
+
+
+class BackboneLoader:
+    """
+    Loads the StandardBackbone on a background thread so the worker can answer
+    /health and cold-start /predict requests while the transformer warms up.
+    One loader per process, shared by every CALLogBackend instance.
+
+    Also owns the per-process task-pool embedding store and redundancy engine,
+    created once the embedding dim is known.
+
+    States: idle -> loading -> ready | failed
+    """
+    IDLE, LOADING, READY, FAILED = "idle", "loading", "ready", "failed"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.state = self.IDLE
+        self.backbone = None
+        self.pool = None
+        self.redundancy = None
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._pid = os.getpid()
+
+    def start(self):
+        """Start loading in the background (idempotent)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked after start (e.g. uWSGI without lazy-apps): the thread did not survive
+                self._reset()
+            if self._thread is not None:
+                return
+            self.state = self.LOADING
+            self._thread = threading.Thread(target=self._load, name="backbone-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self):
+        started = time.time()
+        try:
+            from backbone import StandardBackbone
+            logger.info("⏳ Loading backbone in background...")
+            backbone = StandardBackbone(num_labels=4)
+            if not backbone.remote and backbone.engine == "torch":
+                # Only the in-process torch engine uses torch; sidecar/ONNX workers never import it
+                _seed_torch()
+
+            # Check for pre-trained model in parent dir (ml_service root)
+            pretrained_path = os.path.join(os.path.dirname(__file__), "..", "pretrained_backbone.pkl")
+            if os.path.exists(CHECKPOINT_PATH):
+                logger.info(f"📂 Resuming from checkpoint {CHECKPOINT_PATH}")
+                backbone.load_model(CHECKPOINT_PATH)
+            elif os.path.exists(pretrained_path):
+                logger.info(f"📂 Found pre-trained model at {pretrained_path}")
+                backbone.load_model(pretrained_path)
+            else:
+                logger.info("🆕 No pre-trained model found. Initializing fresh.")
+                backbone.initialize_model()
+
+            from pool_store import PoolStore
+            pool_dir = os.environ.get("POOL_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "pool_store"))
+            self.pool = PoolStore(pool_dir, backbone.embedding_dim)
+            logger.info(f"🗃️ Pool store opened: {len(self.pool)} unlabeled tasks")
+
+            from models import RedundancyEngine
+            self.redundancy = RedundancyEngine(
+                backbone.embedding_dim, threshold=float(os.environ.get("REDUNDANCY_THRESHOLD", 0.7))
+            )
+            # Re-seed the labeled-task index from the pool's tombstoned rows
+            for _, ids, X, _ in self.pool.iter_chunks(removed=True):
+                self.redundancy.add_labeled(ids.tolist(), X)
+
+            self.backbone = backbone
+            self.load_seconds = time.time() - started
+            self.state = self.READY
+            logger.info(f"✅ Backbone ready in {self.load_seconds:.1f}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = self.FAILED
+            logger.error(f"❌ Backbone failed to load: {e}")
+        finally:
+            self._ready.set()
+        if self.state == self.READY:
+            # First full scoring pass for /next here, off the request path
+            try:
+                with timer("next_refresh"):
+                    task_queue.refresh(self.pool, self.backbone.classify_embeddings, self.backbone.model_version)
+            except Exception as e:
+                logger.error(f"❌ /next queue warm-up failed: {e}")
+
+    @property
+    def is_ready(self):
+        return self.state == self.READY
+
+    def wait(self, timeout=None):
+        """Block until loading finishes. Returns the backbone, or None if it failed or timed out."""
+        self.start()
+        self._ready.wait(timeout)
+        return self.backbone if self.is_ready else None
+
+    def status(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+        }
+
+
+backbone_loader = BackboneLoader()
+# Per-(annotator, model version) score vectors, shared by all instances in this process
+user_score_cache = UserScoreCache()
+# Whole predict() responses for repeated identical requests (page loads, refreshes, prefetch)
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get("PREDICTION_CACHE_ENTRIES", 1024)),
+    max_predictions=int(os.environ.get("PREDICTION_CACHE_PREDICTIONS", 200000)),
+)
+# Append-only per-annotator interaction history (restores cost-model windows after restarts)
+interaction_log = InteractionLog(
+    os.environ.get("INTERACTION_LOG_PATH", os.path.join(os.path.dirname(__file__), "interactions.log")),
+    window=AdaptiveCostModel.WINDOW_SIZE
+)
+# state.json snapshot + append-only journal of per-fit deltas
+state_store = StateStore(
+    os.environ.get("STATE_FILE", os.path.join(os.path.dirname(__file__), "state.json")),
+    compact_every=int(os.environ.get("STATE_COMPACT_EVERY", 500)),
+    compact_interval=float(os.environ.get("STATE_SNAPSHOT_INTERVAL", 60)),
+)
+
+
+class ModelCheckpointer:
+    """
+    Saves the classifier (and its replay buffer) at most every `interval` seconds, and
+    only when the model version moved since the last save. The trainer calls maybe_save()
+    after each batch; a background thread started with start() also saves on the interval,
+    so the last updates before a quiet period are not left unsaved, and flush() runs at exit.
+    """
+
+    def __init__(self, path, interval=300.0):
+        self.path = path
+        self.interval = float(interval)
+        self._last_time = time.time()
+        self._last_version = None
+        self._lock = threading.Lock()  # trainer, timer thread and atexit may all save
+        self._source = None
+        self._thread = None
+        self._pid = None
+
+    def maybe_save(self, backbone, force=False):
+        with self._lock:
+            if backbone is None or backbone.model_version == self._last_version:
+                return False
+            if not force and time.time() - self._last_time < self.interval:
+                return False
+            version = backbone.model_version
+            try:
+                backbone.save_model(self.path)
+            except Exception as e:
+                logger.error(f"Checkpoint failed: {e}")
+                return False
+            self._last_time = time.time()
+            self._last_version = version
+            return True
+
+    def start(self, source):
+        """Save `source()` (the live backbone) every `interval` seconds on a daemon thread."""
+        self._source = source
+        if self.interval <= 0:
+            return  # every trainer batch saves already
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            # (Re)start after a fork: the parent's thread does not exist in this worker
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="model-checkpoint", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.maybe_save(self._source(), force=True)
+
+    def flush(self):
+        """Save whatever was trained since the last checkpoint (process exit)."""
+        if self._source is not None:
+            self.maybe_save(self._source(), force=True)
+
+
+model_checkpointer = ModelCheckpointer(
+    CHECKPOINT_PATH, interval=float(os.environ.get("MODEL_CHECKPOINT_INTERVAL", 300))
+)
+# Per-annotator "next best tasks" heaps over the pool, kept current by the trainer (served by /next)
+task_queue = PoolPriorityQueue(max_users=int(os.environ.get("NEXT_QUEUE_USERS", 64)))
+
+
+def cost_params(user_id=None):
+    """(alpha, beta) of an annotator from the persisted state; global average for unknown users."""
+    params = state_store.model_params(user_id) if user_id is not None else None
+    return params or state_store.average_params() or (5.0, 3.0)
+
+
+def next_tasks(user_id=None, k=10):
+    """
+    Best k unlabeled pool tasks for an annotator, from the incrementally maintained heaps.
+    The heaps are per process: tasks another worker labeled are dropped here when the
+    shared pool store no longer has them live.
+    Returns: list of (task_id, score), or None while the backbone/pool/queue is unavailable.
+    """
+    backbone = backbone_loader.backbone
+    pool = backbone_loader.pool
+    if backbone is None or pool is None or task_queue.refreshes == 0:
+        # The loader thread runs the first full scoring pass
+        return None
+    task_queue.score_pending(pool, backbone.classify_embeddings)
+    alpha, beta = cost_params(user_id)
+    user = str(user_id) if user_id is not None else '*'
+    while True:
+        # Over-fetch so a few stale entries do not cost another round
+        ranked = task_queue.top(user, alpha, beta, 2 * k)
+        if not ranked:
+            return []
+        live = pool.contains(np.fromiter((tid for tid, _ in ranked), dtype=np.int64, count=len(ranked)))
+        fresh = [entry for entry, ok in zip(ranked, live) if ok]
+        if len(fresh) < len(ranked):
+            task_queue.remove([tid for (tid, _), ok in zip(ranked, live) if not ok])
+        if len(fresh) >= k or len(ranked) < 2 * k:
+            return fresh[:k]
+
+
+def _train_batch(jobs):
+    """
+    Train on one micro-batch of queued fit() jobs: a single embed + partial_fit over
+    all their samples, then the redundancy/pool bookkeeping.
+    """
+    observe_batch("train_jobs", len(jobs))
+    started = time.perf_counter()
+    with timer("train_batch"):
+        record = _train_jobs(jobs)
+    
+    # --- SPY WINDOW HOOK ---
+    # Real-time training metrics for the dashboard: in-memory ring, served by /spy/*
+    last = jobs[-1]['backend']
+    record.update(last._training_summary())
+    record['jobs'] = len(jobs)
+    record['train_seconds'] = time.perf_counter() - started
+    training_events.push(record)
+
+
+def _prequential_accuracy(backbone, texts, labels):
+    """Accuracy of the current model on a batch before it trains on it (None if not measurable)."""
+    encoder = backbone.label_encoder
+    if not backbone.is_fitted or not hasattr(encoder, 'classes_'):
+        return None
+    known = set(encoder.classes_.tolist())
+    idx = [i for i, label in enumerate(labels) if label in known]
+    if not idx:
+        return None
+    y = encoder.transform([labels[i] for i in idx])
+    proba = backbone.classify_embeddings(backbone.embed([texts[i] for i in idx]))
+    return float(np.mean(np.argmax(proba, axis=1) == y))
+
+
+def _train_jobs(jobs):
+    texts, labels, task_ids, labeled_ids, params = [], [], [], [], {}
+    for job in jobs:
+        texts.extend(job['texts'])
+        labels.extend(job['labels'])
+        task_ids.extend(job['task_ids'])
+        labeled_ids.extend(job['labeled_ids'])
+        params.update(job.get('cost_params', {}))
+
+    record = {'batch_size': len(texts), 'accuracy': None, 'model_version': None, 'replayed': None}
+    if texts:
+        logger.info(f"🧠 Fine-tuning model on {len(texts)} samples from {len(jobs)} submissions...")
+        backbone = backbone_loader.wait()
+        if backbone is not None:
+            record['accuracy'] = _prequential_accuracy(backbone, texts, labels)
+            # partial_fit swaps the new classifier in and bumps model_version in one step
+            result = backbone.partial_fit(texts, labels)
+            record['replayed'] = result.get('replayed')
+            with timer("checkpoint"):
+                model_checkpointer.maybe_save(backbone)
+            model_checkpointer.start(lambda: backbone_loader.backbone)
+            # Labeled tasks join the redundancy index (embeddings are cache hits now)
+            if backbone_loader.redundancy is not None:
+                backbone_loader.redundancy.add_labeled(task_ids, backbone.embed(texts))
+        else:
+            logger.error(f"❌ Backbone unavailable ({backbone_loader.error}). Model NOT updated.")
+
+    # Labeled tasks leave the unlabeled pool and every /next heap
+    if labeled_ids and backbone_loader.pool is not None:
+        backbone_loader.pool.mark_labeled(labeled_ids)
+    if labeled_ids:
+        task_queue.remove(labeled_ids)
+
+    # Re-key the heaps of annotators whose cost parameters moved
+    for user_id, (alpha, beta) in params.items():
+        task_queue.set_params(user_id, alpha, beta)
+
+    backbone = backbone_loader.backbone
+    if backbone is not None:
+        record['model_version'] = int(backbone.model_version)
+        # New classifier: re-score the pool in vectorized chunks (once the loader's first pass ran)
+        pool = backbone_loader.pool
+        if pool is not None and task_queue.refreshes and task_queue.model_version != backbone.model_version:
+            with timer("next_refresh"):
+                task_queue.refresh(pool, backbone.classify_embeddings, backbone.model_version)
+    return record
+
+
+# Recent training metrics (Spy Window), newest last
+training_events = MetricsRing(capacity=int(os.environ.get("SPY_RING_SIZE", 1024)))
+
+# Annotations from every fit() in this process, trained in micro-batches on one thread
+training_queue = TrainingQueue(
+    _train_batch,
+    max_batch=int(os.environ.get("TRAIN_MAX_BATCH", 64)),
+    max_latency=float(os.environ.get("TRAIN_MAX_LATENCY_MS", 500)) / 1000.0,
+)
+
+
+def _drain_on_exit():
+    """Train what fit() already acknowledged, then write the checkpoint (process exit)."""
+    timeout = float(os.environ.get("TRAIN_DRAIN_TIMEOUT", 30))
+    if not training_queue.join(timeout=timeout):
+        logger.error(f"❌ Exiting with {training_queue.depth()} fit() submissions untrained after {timeout:.0f}s")
+    model_checkpointer.flush()
+
+
+atexit.register(_drain_on_exit)
+
+
+def _cache_stats():
+    """Stats of every cache in this process, keyed by cache name."""
+    stats = {"prediction": prediction_cache.stats(), "score": user_score_cache.stats()}
+    backbone = backbone_loader.backbone
+    if backbone is not None:
+        stats["embedding"] = backbone.cache_stats()
+        stats["features"] = backbone.features.stats()
+    return stats
+
+
+# Scrape-time gauges for /metrics (evaluated only when scraped)
+REGISTRY.gauge("cal_log_cache_hit_rate", "Hit rate per cache",
+               lambda: {(name, ): st["hit_rate"] for name, st in _cache_stats().items()}, labelnames=("cache",))
+REGISTRY.gauge("cal_log_cache_hits", "Hits per cache (including disk tier hits)",
+               lambda: {(name, ): st.get("hits", st.get("memory_hits", 0) + st.get("disk_hits", 0))
+                        for name, st in _cache_stats().items()}, labelnames=("cache",))
+REGISTRY.gauge("cal_log_cache_misses", "Misses per cache",
+               lambda: {(name, ): st["misses"] for name, st in _cache_stats().items()}, labelnames=("cache",))
+REGISTRY.gauge("cal_log_training_queue_depth", "fit() submissions waiting for the trainer", training_queue.depth)
+REGISTRY.gauge("cal_log_training_batches", "Micro-batches trained", lambda: training_queue.batches)
+REGISTRY.gauge("cal_log_training_failures", "Micro-batches that raised", lambda: training_queue.failures)
+REGISTRY.gauge("cal_log_model_version", "Classifier version served by predict()",
+               lambda: backbone_loader.backbone.model_version if backbone_loader.backbone is not None else None)
+REGISTRY.gauge("cal_log_pool_tasks", "Unlabeled tasks in the pool store",
+               lambda: len(backbone_loader.pool) if backbone_loader.pool is not None else None)
+REGISTRY.gauge("cal_log_next_queue_tasks", "Pool tasks scored in the /next priority queue", lambda: len(task_queue))
+REGISTRY.gauge("cal_log_replay_buffer_rows", "Labeled embeddings held for replay in partial_fit",
+               lambda: len(backbone_loader.backbone.replay) if backbone_loader.backbone is not None else None)
+REGISTRY.gauge("cal_log_backbone_ready", "1 once the backbone has loaded",
+               lambda: 1 if backbone_loader.is_ready else 0)
+
 class CALLogBackend(LabelStudioMLBase):
     """
     CAL-Log Active Learning Backend for Label Studio.
@@ -54,74 +436,98 @@ class CALLogBackend(LabelStudioMLBase):
         self.global_alpha = 5.0
         self.global_beta = 3.0
         
-        # 2. Lazy Load Backbone (to prevent timeout during init)
+        # 2. Backbone warms up on a background thread (see BackboneLoader)
         self.backbone = None
+        self.loader = backbone_loader
+        self.loader.start()
+        self.score_cache = user_score_cache
+        self.prediction_cache = prediction_cache
+        self.interactions = interaction_log
+        self.trainer = training_queue
         
-        # 3. STATE PERSISTENCE
-        self.state_file = os.path.join(os.path.dirname(__file__), "state.json")
+        # 3. STATE PERSISTENCE (snapshot + journal, see StateStore)
+        self.state_store = state_store
+        self.state_file = self.state_store.path
         self.train_step = 0
         self._load_state()
         
-        # 4. Initialize Backbone immediately
-        self.backbone = self._get_backbone()
-        # CRITICAL: Set self._model to satisfy LabelStudioMLBase check
-        self._model = self.backbone
-        self.model = self.backbone # Fallback for some versions
-        self.setup()
-        logger.info(f"✅ CALLogBackend initialized. Model set: {self._model is not None}")
+        # 4. CRITICAL: Set self._model to satisfy LabelStudioMLBase check
+        # The loader stands in until the backbone is ready (swapped in by _get_backbone)
+        self._model = self.loader
+        self.model = self.loader # Fallback for some versions
+        self._get_backbone(wait=False)
+        logger.info(f"✅ CALLogBackend initialized. Backbone state: {self.loader.state}")
 
     def setup(self):
         """
         Label Studio calls this to initialize the model.
-        We ensure backbone is loaded here.
+        Loading already runs in the background; this never blocks.
         """
         logger.info("🔧 setup() called by Label Studio Manager")
-        self.backbone = self._get_backbone()
-        self._model = self.backbone
-        self.model = self.backbone
-        logger.info(f"✅ setup() completed. Model: {self._model}")
+        self._get_backbone(wait=False)
+        logger.info(f"✅ setup() completed. Backbone state: {self.loader.state}")
         return self._model
 
     def _load_state(self):
-        if os.path.exists(self.state_file):
-            try:
-                import json
-                with open(self.state_file, 'r') as f:
-                    state = json.load(f)
-                    self.train_step = state.get('step', 0)
-                    
-                    # Load User Models
-                    saved_models = state.get('models', {})
-                    for uid, params in saved_models.items():
-                        cm = AdaptiveCostModel()
-                        cm.alpha = params['alpha']
-                        cm.beta = params['beta']
-                        self.cost_models[str(uid)] = cm
-                    
-                    # Recalculate globals
-                    self._update_global_averages()
-                    
-                logger.info(f"💾 State loaded: Step {self.train_step}, {len(self.cost_models)} users")
-            except Exception as e:
-                logger.error(f"Failed to load state: {e}")
+        try:
+            state = self.state_store.load()
+            self.train_step = state.get('step', 0)
+            
+            # Load User Models
+            saved_models = state.get('models', {})
+            for uid, params in saved_models.items():
+                cm = AdaptiveCostModel()
+                cm.alpha = params['alpha']
+                cm.beta = params['beta']
+                self.cost_models[str(uid)] = cm
+            
+            # Recalculate globals
+            self._update_global_averages()
+                
+            logger.info(f"💾 State loaded: Step {self.train_step}, {len(self.cost_models)} users")
+        except Exception as e:
+            logger.error(f"Failed to load state: {e}")
+        
+        # Restore each annotator's sliding window from the interaction log
+        try:
+            windows = self.interactions.load()
+            for uid, history in windows.items():
+                cm = self.cost_models.setdefault(uid, AdaptiveCostModel())
+                cm.replay(history)
+            if windows:
+                self._update_global_averages()
+                logger.info(f"📜 Interaction history replayed for {len(windows)} users")
+        except Exception as e:
+            logger.error(f"Failed to replay interaction log: {e}")
 
-    def _save_state(self):
+    def _save_state(self, user_ids=None):
+        """
+        Journal the current step and the given users' parameters (all users if None).
+        One appended line per call; the full snapshot is rewritten in the background.
+        """
         try:
-            import json
-            # Serialize all user models
+            if user_ids is None:
+                user_ids = list(self.cost_models.keys())
             models_data = {}
-            for uid, cm in self.cost_models.items():
+            for uid in user_ids:
+                cm = self.cost_models[uid]
                 models_data[uid] = {'alpha': cm.alpha, 'beta': cm.beta}
             
-            state = {
+            self.state_store.append({
                 'step': self.train_step,
                 'models': models_data
-            }
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f)
+            })
         except Exception as e:
             logger.error(f"Failed to save state: {e}")
 
+    def _training_summary(self):
+        return {
+            'status': 'ok',
+            'train_step': int(self.train_step),
+            'current_alpha': float(self.global_alpha),
+            'current_beta': float(self.global_beta)
+        }
+
     def _update_global_averages(self):
         """Calculate average cost params across all users for global ranking"""
         if not self.cost_models:
@@ -134,21 +540,104 @@ class CALLogBackend(LabelStudioMLBase):
         self.global_alpha = sum(alphas) / len(alphas)
         self.global_beta = sum(betas) / len(betas)
 
-    def _get_backbone(self):
+    def _get_backbone(self, wait=True):
+        """
+        Return the backbone, or None if it is not ready yet.
+        With wait=True, block until the background load finishes.
+        """
         if self.backbone is None:
-            logger.info("⏳ Lazy loading backbone...")
-            self.backbone = StandardBackbone(num_labels=4)
-            
-            # Check for pre-trained model in parent dir (ml_service root)
-            pretrained_path = os.path.join(os.path.dirname(__file__), "..", "pretrained_backbone.pkl")
-            if os.path.exists(pretrained_path):
-                logger.info(f"📂 Found pre-trained model at {pretrained_path}")
-                self.backbone.load_model(pretrained_path)
-            else:
-                 logger.info("🆕 No pre-trained model found. Initializing fresh.")
-                 self.backbone.initialize_model()
+            backbone = self.loader.wait() if wait else self.loader.backbone
+            if backbone is not None:
+                self.backbone = backbone
+                self._model = backbone
+                self.model = backbone
         return self.backbone
 
+    def _ingest_pool(self, tasks, texts, lengths):
+        """Remember embeddings of tasks not seen before in the pool store (embeds are cache hits)."""
+        pool = self.loader.pool
+        if pool is None:
+            return
+        idx = [i for i, task in enumerate(tasks) if task.get('id') is not None]
+        if not idx:
+            return
+        ids = np.array([tasks[i]['id'] for i in idx], dtype=np.int64)
+        new = np.flatnonzero(~pool.known(ids))
+        if len(new) == 0:
+            return
+        sel = [idx[j] for j in new]
+        embeddings = self.backbone.embed([texts[i] for i in sel])
+        pool.add(ids[new], embeddings, [lengths[i] for i in sel])
+        task_queue.add_pending(ids[new])
+
+    def score_pool(self, chunk_size=65536):
+        """
+        Score the whole unlabeled pool in chunked NumPy passes (no transformer calls).
+        Returns: dict of arrays (task_ids, scores, entropy, costs, label_index, confidence)
+        """
+        backbone = self._get_backbone()
+        if backbone is None or self.loader.pool is None:
+            return None
+        return self.loader.pool.score(
+            backbone.classify_embeddings, self.global_alpha, self.global_beta, chunk_size=chunk_size
+        )
+
+    def _word_count(self, text):
+        """Word count from the backbone's feature store when loaded (cached per text)."""
+        if self.backbone is not None:
+            return int(self.backbone.features.word_counts([text])[0])
+        return len(text.split())
+
+    @staticmethod
+    def _request_user(kwargs):
+        """
+        Annotator requesting predictions, from the Label Studio request context (None if unknown).
+        Matches the `completed_by` ids used as cost model keys in fit().
+        """
+        context = kwargs.get('context') or {}
+        params = kwargs.get('params') or {}
+        if not context and isinstance(params, dict):
+            context = params.get('context') or {}
+        for source in (kwargs, context):
+            if not isinstance(source, dict):
+                continue
+            for field in ('user_id', 'user', 'completed_by'):
+                value = source.get(field)
+                if isinstance(value, dict):
+                    value = value.get('id')
+                if value is not None:
+                    return str(value)
+        return None
+
+    def cost_matrix(self, lengths, user_ids=None):
+        """
+        Predicted annotation seconds for every (annotator, task) pair, one broadcast.
+        user_ids=None covers all known annotators; unknown ids use the global average.
+        Returns: (user_ids, np.ndarray of shape (n_users, n_tasks))
+        """
+        user_ids, alphas, betas = stack_cost_params(
+            self.cost_models, user_ids, default=(self.global_alpha, self.global_beta)
+        )
+        return user_ids, predict_cost_matrix(alphas, betas, lengths)
+
+    def score_matrix(self, entropy, lengths, user_ids=None):
+        """
+        CAL-Log scores (Entropy / Cost) for every (annotator, task) pair.
+        Returns: (user_ids, np.ndarray of shape (n_users, n_tasks))
+        """
+        user_ids, costs = self.cost_matrix(lengths, user_ids)
+        return user_ids, np.asarray(entropy)[None, :] / (costs + 1e-6)
+
+    def _cold_start_predictions(self, tasks, texts):
+        """Cost-only scores (cheaper first) served while the backbone warms up."""
+        lengths = [len(t.split()) for t in texts]
+        predicted_costs = predict_cost_matrix([self.global_alpha], [self.global_beta], lengths)[0]
+        return [{
+            "result": [],
+            "score": float(1.0 / (cost + 1e-6)),
+            "model_version": f"CAL-Log-v{self.train_step}-cold"
+        } for cost in predicted_costs]
+
     def predict(self, tasks, **kwargs):
         """
         Label Studio calls this to get predictions. 
@@ -157,33 +646,100 @@ class CALLogBackend(LabelStudioMLBase):
         # PROVENANCE: Method signature required by Label Studio ML Backend
         # https://github.com/HumanSignal/label-studio-ml-backend
         """
+        REQUESTS.inc(1, "predict")
+        observe_batch("predict", len(tasks))
+        with timer("predict"):
+            return self._predict(tasks, **kwargs)
+
+    def _predict(self, tasks, **kwargs):
         predictions = []
-        backbone = self._get_backbone()
         
         # Extract text from tasks
         texts = [task['data'].get('text') or task['data'].get('content') or "" for task in tasks]
         
-        # Get Model Probabilities and Embeddings
-        probs = backbone.predict_proba(texts)
+        # Never block on warm-up: rank by cost alone until the backbone is ready
+        backbone = self._get_backbone(wait=False)
+        if backbone is None:
+            logger.info(f"⏳ Backbone {self.loader.state}. Serving cost-only cold-start scores.")
+            return self._cold_start_predictions(tasks, texts)
         
-        # Calculate ENTROPY (Uncertainty)
-        entropy = -np.sum(probs * np.log(probs + 1e-10), axis=1)
+        # PERSONALIZATION: rank with the requesting annotator's cost model (global fallback)
+        user_id = self._request_user(kwargs)
+        if user_id in self.cost_models:
+            alpha, beta = self.cost_models[user_id].alpha, self.cost_models[user_id].beta
+        else:
+            alpha, beta = self.global_alpha, self.global_beta
         
-        # Calculate COST (Adaptive)
-        # Calculate COST (Adaptive)
-        # CRITICAL: We use GLOBAL AVERAGE Alpha/Beta for ranking
-        lengths = [len(t.split()) for t in texts]
+        # Tasks without an id are keyed by a hash of their text
+        task_keys = [
+            task.get('id') if task.get('id') is not None else text_key("task", text)
+            for task, text in zip(tasks, texts)
+        ]
+        
+        # Same request, same versions (model, cost params, labeled set, step): stored response
+        redundancy = self.loader.redundancy
+        response_key = (user_id or '*', backbone.model_version, alpha, beta,
+                        redundancy.version if redundancy is not None else -1, self.train_step)
+        cached = self.prediction_cache.get(response_key, task_keys)
+        if cached is not None:
+            return list(cached)
+        
+        # Word counts / log lengths come from the feature store (computed once per text)
+        with timer("features"):
+            features = backbone.features.features(texts)
+        lengths = features[:, 0].astype(np.int64)
+        log_lengths = features[:, 1]
+        # Score vectors are cached per (user, model version, cost params)
+        cache_key = (user_id or '*', backbone.model_version, alpha, beta)
+        entries = self.score_cache.get_many(cache_key, task_keys)
+        missing = [i for i, e in enumerate(entries) if e is None]
+        
+        if missing:
+            # Get Model Probabilities and Embeddings
+            with timer("predict_proba"):
+                probs = backbone.predict_proba([texts[i] for i in missing])
+            
+            # Calculate ENTROPY (Uncertainty)
+            with timer("entropy"):
+                entropy = -np.sum(probs * np.log(probs + 1e-10), axis=1)
+            
+            # Calculate COST (Adaptive)
+            # Cost = Alpha + Beta * log(1 + Length), this user's params as a 1-row cost matrix
+            with timer("cost"):
+                predicted_costs = predict_cost_matrix([alpha], [beta], log_lengths=log_lengths[missing])[0]
+            
+            # Entry: (Entropy / Cost, predicted label, confidence)
+            computed = list(zip(
+                (entropy / (predicted_costs + 1e-6)).tolist(),
+                np.argmax(probs, axis=1).tolist(),
+                np.max(probs, axis=1).tolist()
+            ))
+            for i, entry in zip(missing, computed):
+                entries[i] = entry
+            self.score_cache.put_many(cache_key, [task_keys[i] for i in missing], computed)
         
-        # Manual prediction using global params
-        # Cost = Alpha + Beta * log(1 + Length)
-        log_lens = np.log1p(lengths)
-        predicted_costs = self.global_alpha + (self.global_beta * log_lens)
+        base_scores = np.array([e[0] for e in entries])
+        
+        # Redundancy: penalize near-duplicates of labeled tasks and of higher-ranked tasks
+        penalties = np.ones(len(tasks))
+        if redundancy is not None:
+            with timer("redundancy"):
+                penalties = redundancy.penalties(backbone.embed(texts), base_scores)
+        
+        # Keep the vectors: the pool store enables whole-pool scoring later
+        try:
+            with timer("pool_ingest"):
+                self._ingest_pool(tasks, texts, lengths)
+        except Exception as e:
+            logger.error(f"Failed to update pool store: {e}")
+        
+        serialize_start = time.perf_counter()
         
         for i, task in enumerate(tasks):
             # 1. Generate Prediction (Pre-Annotation)
             # This helps the annotator ("AI suggestion")
-            pred_label_idx = np.argmax(probs[i])
-            confidence = float(np.max(probs[i]))
+            pred_label_idx = entries[i][1]
+            confidence = float(entries[i][2])
             
             # Map index to Label Name (You should sync this with your project config)
             # For now, we return a cluster score
@@ -191,7 +747,7 @@ class CALLogBackend(LabelStudioMLBase):
             # 2. Calculate Active Learning Score
             # Score = Entropy / Cost
             # LabelStudio sorts by "score" if configured
-            cal_log_score = float(entropy[i] / (predicted_costs[i] + 1e-6))
+            cal_log_score = float(base_scores[i] * penalties[i])
             
             predictions.append({
                 "result": [{
@@ -205,14 +761,22 @@ class CALLogBackend(LabelStudioMLBase):
                 "score": cal_log_score,  # THIS IS THE MAGIC NUMBER FOR SORTING
                 "model_version": f"CAL-Log-v{self.train_step}"
             })
-            
-        return predictions
+        
+        self.prediction_cache.put(response_key, task_keys, predictions)
+        STAGE_SECONDS.observe(time.perf_counter() - serialize_start, "serialize")
+        return list(predictions)
 
     def fit(self, annotations, **kwargs):
         """
         Label Studio calls this when you hit "Submit".
         We use this to UPDATE our Adaptive Cost Model AND Fine-Tune the Backbone.
+        The cost model updates inline; backbone training is queued (see TrainingQueue).
         """
+        REQUESTS.inc(1, "fit")
+        with timer("fit"):
+            return self._fit(annotations, **kwargs)
+
+    def _fit(self, annotations, **kwargs):
         self.train_step += 1
         
         # --------------------------------------------------------------
@@ -234,18 +798,23 @@ class CALLogBackend(LabelStudioMLBase):
         logger.info(f"Received {len(annotations)} annotations for training...")
         
         interaction_logs = []
+        updated_users = []
         train_texts = []
         train_labels = []
+        train_ids = []
+        labeled_ids = []
         
         for ann in annotations:
             # 1. Extract Interaction Data for Cost Model
             # LabelStudio payload usually contains task data in ann['task']['data']
             task_data = ann.get('task', {}).get('data', {})
             text = task_data.get('text') or task_data.get('content') or ""
+            if ann.get('task', {}).get('id') is not None:
+                labeled_ids.append(ann['task']['id'])
             
             if 'lead_time' in ann:
                 interaction_logs.append({
-                    'length': len(text.split()), 
+                    'length': self._word_count(text), 
                     'time_ms': ann['lead_time'] * 1000,
                     'text': text
                 })
@@ -258,6 +827,7 @@ class CALLogBackend(LabelStudioMLBase):
                         label = res['value']['choices'][0]
                         train_texts.append(text)
                         train_labels.append(label)
+                        train_ids.append(ann.get('task', {}).get('id'))
                         break
             except Exception as e:
                 logger.error(f"Error parsing annotation: {e}")
@@ -277,7 +847,10 @@ class CALLogBackend(LabelStudioMLBase):
             user_model = self.cost_models[user_id]
             old_alpha, old_beta = user_model.alpha, user_model.beta
             
-            user_model.update(interaction_logs)
+            accepted = user_model.update(interaction_logs)
+            with timer("persist"):
+                self.interactions.append(user_id, accepted)
+            updated_users.append(user_id)
             
             new_alpha, new_beta = user_model.alpha, user_model.beta
             logger.info(f"🔄 Cost Model Updated [User {user_id}]: α {old_alpha:.2f}→{new_alpha:.2f}, β {old_beta:.2f}→{new_beta:.2f}")
@@ -286,35 +859,26 @@ class CALLogBackend(LabelStudioMLBase):
             self._update_global_averages()
         else:
             logger.warning("⚠️ No interaction logs found (Lead Time missing?). Cost parameters NOT updated.")
+        
+        # Journal the step and this annotator's new parameters (cheap append)
+        with timer("persist"):
+            self._save_state(updated_users)
 
         # --- B. UPDATE PREDICTION MODEL (Accuracy) ---
-        if train_texts and train_labels:
-            logger.info(f"🧠 Fine-tuning model on {len(train_texts)} new samples...")
-            backbone = self._get_backbone()
-            backbone.partial_fit(train_texts, train_labels)
+        # Embedding + partial_fit run on the background trainer, coalesced with
+        # annotations from concurrent webhooks; the webhook returns right away
+        depth = self.trainer.submit({
+            'backend': self,
+            'texts': train_texts,
+            'labels': train_labels,
+            'task_ids': train_ids,
+            'labeled_ids': labeled_ids,
+            'cost_params': {uid: (self.cost_models[uid].alpha, self.cost_models[uid].beta) for uid in updated_users},
+        })
+        if train_texts:
+            logger.info(f"📥 Queued {len(train_texts)} samples for training (queue depth {depth})")
         
         # Return native types to ensure JSON serialization safety
-        result_dict = {
-            'status': 'ok',
-            'train_step': int(self.train_step),
-            'current_alpha': float(self.global_alpha),
-            'current_beta': float(self.global_beta)
-        }
-        
-        # Save persistent state
-        self._save_state()
-        
-        # --- SPY WINDOW HOOK ---
-        # Write real-time metrics to Client Public folder for visualization
-        try:
-             import json
-             # Direct path to React Client public folder
-             metric_path = r"d:\ResearchTool\client\public\spy_metrics.json"
-             with open(metric_path, "w") as f:
-                  json.dump(result_dict, f)
-             logger.info(f"🕵️‍♂️ Spy Metrics written to {metric_path}")
-        except Exception as e:
-             logger.error(f"Error writing spy metrics: {e}")
-        # -----------------------
-
+        result_dict = self._training_summary()
+        result_dict['queue_depth'] = int(depth)
         return result_dict
@@ -0,0 +1,347 @@
+"""
+Task-pool embedding store.
+Append-only, memory-mapped float16 embedding matrix keyed by Label Studio task id,
+with tombstones for labeled/deleted tasks and chunked whole-pool CAL-Log scoring.
+
+Layout (inside `directory`):
+    meta.json       - {"dim": ..., "dtype": ...}
+    embeddings.bin  - raw (capacity, dim) matrix, grown by doubling
+    tombstones.bin  - uint8 per row (1 = labeled/deleted/superseded)
+    lengths.bin     - int32 word count per row (cost feature)
+    ids.bin         - int64 task id per row, appended last (commit marker for the row)
+    pool.lock       - flock shared by every worker
+
+Workers append under an exclusive flock after folding in rows other workers committed,
+so row numbers never overlap. Readers pick up new rows when ids.bin has grown.
+Tombstones are written through the shared memory map and are visible to all workers.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from file_lock import FileLock
+
+EPSILON = 1e-10
+
+
+class PoolStore:
+    """
+    Usage:
+        pool = PoolStore("./pool_store", dim=384)
+        pool.add(task_ids, embeddings, word_counts)
+        pool.mark_labeled([task_id])
+        result = pool.score(backbone.classify_embeddings, alpha, beta)
+    """
+
+    INITIAL_CAPACITY = 4096
+
+    def __init__(self, directory, dim, dtype="float16"):
+        self.directory = directory
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._flock = FileLock(os.path.join(directory, "pool.lock"))
+
+        self._paths = {name: os.path.join(directory, f"{name}.bin")
+                       for name in ("embeddings", "tombstones", "lengths", "ids")}
+        self._capacity = 0
+        self._emb = None
+        self._tomb = None
+        with self._flock.hold():
+            self._check_meta()
+            n = self._repair()
+            self._ids = self._read_column("ids", np.int64)
+            self._lengths = self._read_column("lengths", np.int32)
+            self._count = n
+            self._open_matrices(max(self.INITIAL_CAPACITY, n))
+            # Rows past the committed count belong to an interrupted append
+            self._tomb[n:] = 0
+
+        # id -> row index: sorted arrays over the first `_indexed` rows, plus a small
+        # dict for rows appended since (merged into the arrays once it grows)
+        self._sorted_ids = None
+        self._sorted_rows = None
+        self._indexed = 0
+        self._recent = {}
+        self._rebuild_index()
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    def _check_meta(self):
+        meta_path = os.path.join(self.directory, "meta.json")
+        meta = {"dim": self.dim, "dtype": self.dtype.name}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                if json.load(f) == meta:
+                    return
+            # Embedding space changed: the stored pool is useless
+            for path in self._paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def _read_column(self, name, dtype, start=0, count=-1):
+        path = self._paths[name]
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=dtype)
+        return np.fromfile(path, dtype=dtype, count=count, offset=start * np.dtype(dtype).itemsize)
+
+    def _committed(self):
+        """Rows whose id reached ids.bin (by any worker)."""
+        path = self._paths["ids"]
+        return os.path.getsize(path) // 8 if os.path.exists(path) else 0
+
+    def _repair(self):
+        """
+        Cut lengths.bin and ids.bin back to the rows committed in both, so a crash between
+        the two appends cannot shift later rows (exclusive flock held). Returns the row count.
+        """
+        sizes = {name: os.path.getsize(self._paths[name]) if os.path.exists(self._paths[name]) else 0
+                 for name in ("ids", "lengths")}
+        n = min(sizes["ids"] // 8, sizes["lengths"] // 4)
+        for name, itemsize in (("ids", 8), ("lengths", 4)):
+            if sizes[name] != n * itemsize:
+                with open(self._paths[name], "ab") as f:
+                    f.truncate(n * itemsize)
+        return n
+
+    def _sync_locked(self):
+        """Fold in rows other workers committed since we last looked (flock held)."""
+        committed = self._committed()
+        if committed <= self._count:
+            return
+        new = committed - self._count
+        ids = self._read_column("ids", np.int64, self._count, new)
+        lengths = self._read_column("lengths", np.int32, self._count, new)
+        if committed > self._capacity:
+            self._open_matrices(max(committed, self._capacity * 2))
+        start = self._count
+        self._ids = np.concatenate([self._ids, ids])
+        self._lengths = np.concatenate([self._lengths, lengths])
+        self._count = committed
+        for offset, tid in enumerate(ids.tolist()):
+            self._recent[tid] = start + offset
+        if len(self._recent) > self.RECENT_LIMIT:
+            self._rebuild_index()
+
+    def _sync(self):
+        if self._committed() > self._count:
+            with self._lock, self._flock.hold(exclusive=False):
+                self._sync_locked()
+
+    def _grow_file(self, path, nbytes):
+        with open(path, "ab") as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+
+    def _open_matrices(self, capacity):
+        for mm in (self._emb, self._tomb):
+            if mm is not None:
+                mm.flush()
+        row_bytes = self.dim * self.dtype.itemsize
+        self._grow_file(self._paths["embeddings"], capacity * row_bytes)
+        self._grow_file(self._paths["tombstones"], capacity)
+        self._capacity = capacity
+        self._emb = np.memmap(self._paths["embeddings"], dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        self._tomb = np.memmap(self._paths["tombstones"], dtype=np.uint8, mode="r+", shape=(capacity,))
+
+    def _append_column(self, name, values):
+        with open(self._paths[name], "ab") as f:
+            values.tofile(f)
+
+    # ------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------
+    RECENT_LIMIT = 8192
+
+    def _rebuild_index(self):
+        order = np.argsort(self._ids[:self._count], kind="stable")
+        self._sorted_ids = self._ids[order]
+        self._sorted_rows = order
+        self._indexed = self._count
+        self._recent = {}
+
+    def rows_for(self, task_ids, include_removed=False):
+        """Latest row per task id (-1 if absent, or tombstoned unless include_removed)."""
+        self._sync()
+        return self._rows_for(task_ids, include_removed)
+
+    def _rows_for(self, task_ids, include_removed=False):
+        task_ids = np.asarray(task_ids, dtype=np.int64)
+        rows = np.full(len(task_ids), -1, dtype=np.int64)
+        if self._count == 0 or len(task_ids) == 0:
+            return rows
+        with self._lock:
+            sorted_ids = self._sorted_ids
+            candidate = np.full(len(task_ids), -1, dtype=np.int64)
+            if len(sorted_ids):
+                # side='right' - 1 lands on the last (newest) row for duplicated ids
+                pos = np.clip(np.searchsorted(sorted_ids, task_ids, side="right") - 1, 0, None)
+                found = sorted_ids[pos] == task_ids
+                candidate[found] = self._sorted_rows[pos[found]]
+            if self._recent:
+                for i, tid in enumerate(task_ids.tolist()):
+                    row = self._recent.get(tid)
+                    if row is not None:
+                        candidate[i] = row
+            hit = candidate >= 0
+            candidate = np.clip(candidate, 0, None)
+            if not include_removed:
+                hit &= self._tomb[candidate] == 0
+            rows[hit] = candidate[hit]
+        return rows
+
+    def contains(self, task_ids):
+        """True for tasks that are live in the pool."""
+        return self.rows_for(task_ids) >= 0
+
+    def known(self, task_ids):
+        """True for tasks that were ever added (live or tombstoned)."""
+        return self.rows_for(task_ids, include_removed=True) >= 0
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+    def add(self, task_ids, embeddings, lengths):
+        """
+        Append tasks to the pool. Re-adding a task id supersedes its previous row.
+
+        Args:
+            task_ids: Label Studio task ids, shape (n,)
+            embeddings: shape (n, dim)
+            lengths: word count per task, shape (n,)
+        """
+        task_ids = np.asarray(task_ids, dtype=np.int64)
+        if len(task_ids) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=self.dtype)
+        lengths = np.asarray(lengths, dtype=np.int32)
+
+        with self._lock, self._flock.hold():
+            self._repair()
+            self._sync_locked()
+            self._remove_rows(self._rows_for(task_ids))
+            start, end = self._count, self._count + len(task_ids)
+            if end > self._capacity:
+                self._open_matrices(max(end, self._capacity * 2))
+
+            self._emb[start:end] = embeddings
+            self._tomb[start:end] = 0
+            self._emb.flush()
+            self._append_column("lengths", lengths)
+            self._append_column("ids", task_ids)
+
+            self._ids = np.concatenate([self._ids, task_ids])
+            self._lengths = np.concatenate([self._lengths, lengths])
+            self._count = end
+            for offset, tid in enumerate(task_ids.tolist()):
+                self._recent[tid] = start + offset
+            if len(self._recent) > self.RECENT_LIMIT:
+                self._rebuild_index()
+
+    def remove(self, task_ids):
+        """Tombstone tasks (labeled or deleted). Returns the number of rows removed."""
+        with self._lock:
+            return self._remove_rows(self.rows_for(task_ids))
+
+    def _remove_rows(self, rows):
+        rows = rows[rows >= 0]
+        if len(rows):
+            self._tomb[rows] = 1
+            self._tomb.flush()
+        return len(rows)
+
+    mark_labeled = remove
+
+    def __len__(self):
+        """Number of live (unlabeled) tasks."""
+        self._sync()
+        if self._count == 0:
+            return 0
+        return int(self._count - np.count_nonzero(self._tomb[:self._count]))
+
+    # ------------------------------------------------------------------
+    # Chunked reads
+    # ------------------------------------------------------------------
+    def iter_chunks(self, chunk_size=65536, removed=False):
+        """
+        Yield (rows, task_ids, embeddings float32, lengths) for live rows, chunk by chunk.
+        With removed=True, yield labeled/deleted rows instead (superseded rows are skipped).
+        Only one chunk is materialized in RAM at a time.
+        """
+        self._sync()
+        count = self._count
+        for start in range(0, count, chunk_size):
+            end = min(start + chunk_size, count)
+            flag = 1 if removed else 0
+            rows = np.flatnonzero(self._tomb[start:end] == flag) + start
+            if removed and len(rows):
+                # A re-added task has a tombstoned old row but is still live
+                rows = rows[~self.contains(self._ids[rows])]
+            if len(rows) == 0:
+                continue
+            yield (
+                rows,
+                self._ids[rows],
+                np.asarray(self._emb[rows], dtype=np.float32),
+                self._lengths[rows],
+            )
+
+    def embeddings_for(self, task_ids):
+        """float32 embeddings for the given ids (rows for missing ids are NaN)."""
+        rows = self.rows_for(task_ids)
+        out = np.full((len(rows), self.dim), np.nan, dtype=np.float32)
+        found = rows >= 0
+        out[found] = self._emb[rows[found]]
+        return out
+
+    def lengths_for(self, task_ids):
+        """Word counts for the given ids (-1 for missing ids)."""
+        rows = self.rows_for(task_ids)
+        out = np.full(len(rows), -1, dtype=np.int32)
+        found = rows >= 0
+        out[found] = self._lengths[rows[found]]
+        return out
+
+    def score(self, proba_fn, alpha, beta, chunk_size=65536):
+        """
+        Score every live task: probabilities -> entropy -> CAL-Log score (entropy / cost).
+
+        Args:
+            proba_fn: callable(embeddings) -> probabilities (n, n_classes),
+                      e.g. StandardBackbone.classify_embeddings
+            alpha, beta: cost parameters (cost = alpha + beta * log1p(word_count))
+
+        Returns:
+            dict of arrays aligned on live rows: task_ids, scores, entropy, costs, label_index, confidence
+        """
+        columns = {
+            "task_ids": np.int64, "scores": np.float32, "entropy": np.float32,
+            "costs": np.float32, "label_index": np.int32, "confidence": np.float32,
+        }
+        # Collected per chunk: other workers may append or tombstone rows while we score
+        parts = {name: [] for name in columns}
+        for _, ids, X, lengths in self.iter_chunks(chunk_size):
+            probs = proba_fn(X)
+            entropy = -np.sum(probs * np.log(probs + EPSILON), axis=1)
+            costs = alpha + beta * np.log1p(lengths)
+            parts["task_ids"].append(ids)
+            parts["entropy"].append(entropy)
+            parts["costs"].append(costs)
+            parts["scores"].append(entropy / (costs + 1e-6))
+            parts["label_index"].append(np.argmax(probs, axis=1))
+            parts["confidence"].append(np.max(probs, axis=1))
+        return {
+            name: np.concatenate(parts[name]).astype(dtype, copy=False) if parts[name] else np.empty(0, dtype=dtype)
+            for name, dtype in columns.items()
+        }
+
+    def close(self):
+        with self._lock:
+            self._emb.flush()
+            self._tomb.flush()
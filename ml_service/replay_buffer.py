@@ -0,0 +1,189 @@
+"""
+Bounded replay buffer of labeled embeddings for incremental training.
+partial_fit mixes each new batch with a sample of earlier annotations, so the SGD head
+does not drift toward the latest labels, and never re-embeds old texts: rows are kept
+as float16 embeddings with int32 class indices.
+
+Sampling strategies:
+- "balanced": class-balanced reservoir. While full, a sample of an under-represented
+  class evicts a random row of the largest class; a sample of a class already at its
+  fair share replaces one of its own rows with reservoir probability.
+- "reservoir": plain reservoir sampling (uniform over everything seen).
+
+Usage:
+    buffer = ReplayBuffer(dim=384, capacity=10000, max_bytes=32 * 2**20)
+    X_old, y_old = buffer.sample(64)
+    buffer.add(X_new, y_new)
+"""
+import threading
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Args:
+        dim: embedding dimension
+        capacity: maximum rows
+        max_bytes: memory ceiling for the stored rows; lowers `capacity` if it is tighter
+        strategy: "balanced" or "reservoir"
+        seed: random seed (sampling and eviction)
+    """
+
+    STRATEGIES = ("balanced", "reservoir")
+
+    def __init__(self, dim, capacity=10000, max_bytes=None, strategy="balanced", seed=42):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replay strategy {strategy!r} (expected one of {self.STRATEGIES})")
+        self.dim = int(dim)
+        self.row_bytes = self.dim * np.dtype(np.float16).itemsize + np.dtype(np.int32).itemsize
+        if max_bytes is not None:
+            capacity = min(int(capacity), int(max_bytes) // self.row_bytes)
+        self.capacity = max(0, int(capacity))
+        self.strategy = strategy
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._X = np.zeros((self.capacity, self.dim), dtype=np.float16)
+        self._y = np.zeros(self.capacity, dtype=np.int32)
+        self._size = 0
+        self._seen = 0
+        self._seen_per_class = {}  # class index -> samples offered
+        self._stored_per_class = {}  # class index -> rows held
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._X.nbytes + self._y.nbytes
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def add(self, X, y):
+        """Offer labeled rows to the buffer. Returns the number of rows stored."""
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.dim)
+        y = np.asarray(y).reshape(-1).tolist()
+        if self.capacity == 0:
+            return 0
+        stored = 0
+        with self._lock:
+            for x, label in zip(X, y):
+                label = int(label)
+                self._seen += 1
+                self._seen_per_class[label] = self._seen_per_class.get(label, 0) + 1
+                slot = self._slot_for(label)
+                if slot is None:
+                    continue
+                if slot < self._size:
+                    old = int(self._y[slot])
+                    self._stored_per_class[old] -= 1
+                else:
+                    self._size += 1
+                self._X[slot] = x
+                self._y[slot] = label
+                self._stored_per_class[label] = self._stored_per_class.get(label, 0) + 1
+                stored += 1
+        return stored
+
+    def _slot_for(self, label):
+        """Row to write `label` into (== size to append), or None to skip the sample."""
+        if self._size < self.capacity:
+            return self._size
+        if self.strategy == "reservoir":
+            j = int(self._rng.integers(self._seen))
+            return j if j < self.capacity else None
+        count = self._stored_per_class.get(label, 0)
+        largest = max(self._stored_per_class, key=self._stored_per_class.get)
+        if count < self._stored_per_class[largest]:
+            # Under-represented class: take a row from the largest class
+            return self._random_row(largest)
+        # At its fair share: reservoir sampling within the class
+        if self._rng.random() * self._seen_per_class[label] >= count:
+            return None
+        return self._random_row(label)
+
+    def _random_row(self, label):
+        return int(self._rng.choice(np.flatnonzero(self._y[:self._size] == label)))
+
+    def remap(self, mapping):
+        """Relabel stored rows after the label encoding changed ({old index: new index})."""
+        mapping = {int(k): int(v) for k, v in mapping.items()}
+        with self._lock:
+            y = self._y[:self._size]
+            lookup = np.arange(max(list(mapping) + [int(y.max(initial=0))]) + 1, dtype=np.int32)
+            for old, new in mapping.items():
+                lookup[old] = new
+            self._y[:self._size] = lookup[y]
+            self._seen_per_class = {mapping.get(k, k): v for k, v in self._seen_per_class.items()}
+            self._stored_per_class = {mapping.get(k, k): v for k, v in self._stored_per_class.items()}
+
+    def clear(self):
+        """Drop every stored row (e.g. after the label encoding was rebuilt from scratch)."""
+        with self._lock:
+            self._size = 0
+            self._seen = 0
+            self._seen_per_class = {}
+            self._stored_per_class = {}
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def sample(self, n):
+        """Up to n random stored rows (without replacement) as (float32 X, int y)."""
+        with self._lock:
+            n = min(int(n), self._size)
+            if n <= 0:
+                return np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=np.int64)
+            rows = np.sort(self._rng.choice(self._size, size=n, replace=False))
+            return self._X[rows].astype(np.float32), self._y[rows].astype(np.int64)
+
+    def all(self):
+        """Every stored row as (float32 X, int y)."""
+        with self._lock:
+            return self._X[:self._size].astype(np.float32), self._y[:self._size].astype(np.int64)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self._size,
+                "capacity": self.capacity,
+                "bytes": self.nbytes,
+                "seen": self._seen,
+                "per_class": {int(k): int(v) for k, v in sorted(self._stored_per_class.items()) if v},
+                "strategy": self.strategy,
+            }
+
+    # ------------------------------------------------------------------
+    # Persistence (stored inside the model checkpoint)
+    # ------------------------------------------------------------------
+    def state_dict(self):
+        with self._lock:
+            return {
+                "dim": self.dim,
+                "strategy": self.strategy,
+                "X": self._X[:self._size].copy(),
+                "y": self._y[:self._size].copy(),
+                "seen": self._seen,
+                "seen_per_class": dict(self._seen_per_class),
+            }
+
+    def load_state_dict(self, state):
+        """Restore saved rows; keeps this buffer's capacity (a random subset if it shrank)."""
+        if int(state["dim"]) != self.dim:
+            raise ValueError(f"Replay buffer dim {state['dim']} does not match {self.dim}")
+        X = np.asarray(state["X"], dtype=np.float16)
+        y = np.asarray(state["y"], dtype=np.int32)
+        if len(y) > self.capacity:
+            keep = np.sort(self._rng.choice(len(y), size=self.capacity, replace=False))
+            X, y = X[keep], y[keep]
+        with self._lock:
+            self._size = len(y)
+            self._X[:self._size] = X
+            self._y[:self._size] = y
+            self._seen = max(int(state.get("seen", 0)), self._size)
+            self._seen_per_class = {int(k): int(v) for k, v in state.get("seen_per_class", {}).items()}
+            labels, counts = np.unique(y, return_counts=True)
+            self._stored_per_class = {int(k): int(v) for k, v in zip(labels, counts)}
+            for label, count in self._stored_per_class.items():
+                self._seen_per_class[label] = max(self._seen_per_class.get(label, 0), count)
@@ -0,0 +1,132 @@
+"""
+Cross-request dynamic batching.
+Concurrent callers (e.g. several small /predict requests) hand their items to one
+dispatcher thread, which waits a few milliseconds for company, runs a single batched
+call and splits the rows back to each caller.
+
+A batch closes when any of these holds:
+- it reached `max_batch` items,
+- the first caller has waited `max_wait` seconds,
+- waiting longer would push the first caller past `latency_budget`, given the
+  measured per-item cost of recent batches.
+Requests of `max_batch` items or more skip the queue: they are big enough on their own.
+"""
+import os
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from metrics import STAGE_SECONDS, observe_batch
+
+
+class _Pending:
+    __slots__ = ("items", "arrived", "done", "result", "error")
+
+    def __init__(self, items):
+        self.items = items
+        self.arrived = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    Args:
+        batch_fn: callable(list) -> np.ndarray with one row per item
+        max_batch: items per coalesced call
+        max_wait: seconds the first caller may wait for others to join
+        latency_budget: seconds a caller should spend in wait + batched call (target, not a hard limit)
+        name: label used in metrics
+    """
+
+    def __init__(self, batch_fn, max_batch=256, max_wait=0.005, latency_budget=0.25, name="coalesce"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = float(max_wait)
+        self.latency_budget = float(latency_budget)
+        self.name = name
+        self._pending = deque()
+        self._pending_items = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._per_item = None  # EWMA of seconds per item of the batched call
+
+    def __call__(self, items):
+        items = list(items)
+        if not items or len(items) >= self.max_batch or self.max_wait <= 0:
+            return self.batch_fn(items)
+        request = _Pending(items)
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append(request)
+            self._pending_items += len(items)
+            self._cond.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            # (Re)start after a fork or if the dispatcher died
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-dispatcher", daemon=True)
+            self._thread.start()
+
+    def _window_closed(self, first):
+        if self._pending_items >= self.max_batch:
+            return True
+        waited = time.perf_counter() - first.arrived
+        if waited >= self.max_wait:
+            return True
+        # Leave the batched call enough of the first caller's budget
+        expected = (self._per_item or 0.0) * self._pending_items
+        return waited + expected >= self.latency_budget
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            first = self._pending[0]
+            while not self._window_closed(first):
+                self._cond.wait(max(0.0, first.arrived + self.max_wait - time.perf_counter()))
+            batch, size = [], 0
+            while self._pending and size + len(self._pending[0].items) <= self.max_batch:
+                request = self._pending.popleft()
+                batch.append(request)
+                size += len(request.items)
+            if not batch:
+                # First request alone exceeds max_batch (can only happen if max_batch shrank)
+                batch.append(self._pending.popleft())
+            self._pending_items -= sum(len(r.items) for r in batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            items = [item for request in batch for item in request.items]
+            start = time.perf_counter()
+            for request in batch:
+                STAGE_SECONDS.observe(start - request.arrived, f"{self.name}_wait")
+            observe_batch(self.name, len(items))
+            try:
+                out = self.batch_fn(items)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            elapsed = time.perf_counter() - start
+            per_item = elapsed / max(1, len(items))
+            self._per_item = per_item if self._per_item is None else 0.8 * self._per_item + 0.2 * per_item
+
+            offset = 0
+            for request in batch:
+                n = len(request.items)
+                request.result = np.array(out[offset:offset + n])  # own copy, not a view of the batch
+                offset += n
+                request.done.set()
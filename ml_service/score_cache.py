@@ -0,0 +1,119 @@
+"""
+Caches for CALLogBackend.predict.
+UserScoreCache: per-task score entries per (user, model version, cost params), so
+repeated queue fetches by the same annotator skip probabilities/entropy/cost.
+PredictionCache: whole responses, so an identical repeated request returns the
+stored prediction dicts without touching features, penalties or the pool.
+A new model version or new cost parameters simply produce a new key: stale
+entries are never scanned, they age out of the LRU.
+"""
+import threading
+from collections import OrderedDict
+
+
+class UserScoreCache:
+    """
+    Args:
+        max_keys: number of (user, version) score vectors kept (LRU)
+        max_tasks_per_key: tasks remembered per score vector
+    """
+
+    def __init__(self, max_keys=256, max_tasks_per_key=100000):
+        self.max_keys = int(max_keys)
+        self.max_tasks_per_key = int(max_tasks_per_key)
+        self._vectors = OrderedDict()  # key -> {task_id: entry}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, key, task_ids):
+        """Cached entries aligned with task_ids (None for misses and tasks without id)."""
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += len(task_ids)
+                return [None] * len(task_ids)
+            self._vectors.move_to_end(key)
+            entries = [vector.get(tid) if tid is not None else None for tid in task_ids]
+            found = sum(e is not None for e in entries)
+            self.hits += found
+            self.misses += len(entries) - found
+            return entries
+
+    def put_many(self, key, task_ids, entries):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                vector = self._vectors[key] = {}
+                while len(self._vectors) > self.max_keys:
+                    self._vectors.popitem(last=False)
+            self._vectors.move_to_end(key)
+            for tid, entry in zip(task_ids, entries):
+                if tid is not None and len(vector) < self.max_tasks_per_key:
+                    vector[tid] = entry
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "keys": len(self._vectors),
+        }
+
+
+class PredictionCache:
+    """
+    Finished predict() responses, keyed by (version key, task keys).
+    The version key holds everything a response depends on (annotator, model version,
+    cost params, labeled-set version), so a bump makes old responses unreachable and
+    they age out of the LRU; nothing is scanned or invalidated explicitly.
+
+    Args:
+        max_entries: responses kept (LRU)
+        max_predictions: total prediction dicts kept across all responses
+    """
+
+    def __init__(self, max_entries=1024, max_predictions=200000):
+        self.max_entries = int(max_entries)
+        self.max_predictions = int(max_predictions)
+        self._responses = OrderedDict()  # (version_key, task_keys) -> [prediction dict]
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version_key, task_keys):
+        key = (version_key, tuple(task_keys))
+        with self._lock:
+            predictions = self._responses.get(key)
+            if predictions is None:
+                self.misses += 1
+                return None
+            self._responses.move_to_end(key)
+            self.hits += 1
+            return predictions
+
+    def put(self, version_key, task_keys, predictions):
+        if len(predictions) > self.max_predictions:
+            return
+        key = (version_key, tuple(task_keys))
+        with self._lock:
+            old = self._responses.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._responses[key] = predictions
+            self._size += len(predictions)
+            while len(self._responses) > self.max_entries or self._size > self.max_predictions:
+                _, evicted = self._responses.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "responses": len(self._responses),
+            "predictions": self._size,
+        }
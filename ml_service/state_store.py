@@ -0,0 +1,197 @@
+"""
+Crash-safe, write-behind persistence for CALLogBackend state.
+The hot path appends small JSON deltas to a journal; a background thread periodically
+folds them into a snapshot written to a temp file and atomically renamed into place.
+Recovery = latest snapshot + journal replay.
+
+Every uWSGI worker appends to the same journal. Appends hold a shared flock and a
+snapshot holds it exclusively while it folds the on-disk snapshot + journal (all
+workers' deltas) and truncates the journal, so no worker's delta is lost.
+
+Deltas carry absolute values ({"step": n, "models": {user: {"alpha", "beta"}}}),
+so replaying a delta that is already in the snapshot is harmless.
+"""
+import os
+import json
+import copy
+import logging
+import threading
+
+from file_lock import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+def _merge(state, delta):
+    if "step" in delta:
+        state["step"] = delta["step"]
+    models = state.setdefault("models", {})
+    for uid, params in delta.get("models", {}).items():
+        models[str(uid)] = dict(params)
+
+
+def atomic_write_json(path, data):
+    """Write JSON to `path` via temp file + fsync + rename, so readers never see a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class StateStore:
+    """
+    Usage:
+        store = StateStore("state.json")
+        state = store.load()                                  # snapshot + journal
+        store.append({"step": 12, "models": {"7": {"alpha": 4.1, "beta": 2.2}}})
+
+    Files: <path> (snapshot), <path>.journal (live deltas), <path>.lock (flock),
+    <path>.journal.1 (left by older versions; replayed on load, removed by the next snapshot).
+    """
+
+    def __init__(self, path, compact_every=500, compact_interval=60.0):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.rotated_path = self.journal_path + ".1"
+        self.compact_every = int(compact_every)
+        self.compact_interval = float(compact_interval)
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()  # one snapshot at a time
+        self._flock = FileLock(path + ".lock")  # shared with the other workers
+        self._state = {"step": 0, "models": {}}
+        self._journal = None
+        self._pending = 0
+        self._average = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.snapshots = 0
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _replay(path, state):
+        if not os.path.exists(path):
+            return 0
+        applied = 0
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    _merge(state, json.loads(line))
+                    applied += 1
+                except ValueError:
+                    # Torn line from a crash mid-append: skip it, later deltas still apply
+                    continue
+        return applied
+
+    def _read_disk(self):
+        """Snapshot with every worker's journaled deltas replayed on top (call with the flock held)."""
+        state = {"step": 0, "models": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    state.update(json.load(f))
+            except ValueError as e:
+                logger.error(f"Snapshot {self.path} unreadable ({e}); recovering from journal only")
+        replayed = self._replay(self.rotated_path, state) + self._replay(self.journal_path, state)
+        return state, replayed
+
+    def load(self):
+        """Latest snapshot with the journal replayed on top. Returns a copy of the state dict."""
+        with self._lock, self._flock.hold():
+            state, replayed = self._read_disk()
+            if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path):
+                with open(self.journal_path, "rb+") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")  # terminate a torn line so new deltas start clean
+            self._state = state
+            self._average = None
+            self._pending = replayed
+            if replayed:
+                logger.info(f"💾 Replayed {replayed} journal entries onto {self.path}")
+            return copy.deepcopy(state)
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            # Forked: the parent's thread and file handle are not ours
+            self._pid = os.getpid()
+            self._thread = None
+            self._journal = None
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="state-snapshot", daemon=True)
+            self._thread.start()
+
+    def append(self, delta):
+        """Hot path: one small JSON line appended and flushed; full snapshot happens in the background."""
+        with self._lock:
+            self._ensure_thread()
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")  # O_APPEND: lands at the end even after a truncate
+            with self._flock.hold(exclusive=False):
+                self._journal.write(json.dumps(delta, separators=(",", ":")) + "\n")
+                self._journal.flush()
+            _merge(self._state, delta)
+            self._average = None
+            self._pending += 1
+            if self._pending >= self.compact_every:
+                self._wake.set()
+
+    def state(self):
+        with self._lock:
+            return copy.deepcopy(self._state)
+
+    def model_params(self, user_id):
+        """(alpha, beta) of one annotator, or None if unknown. No copy of the full state."""
+        with self._lock:
+            params = self._state.get("models", {}).get(str(user_id))
+            return None if params is None else (params["alpha"], params["beta"])
+
+    def average_params(self):
+        """Mean (alpha, beta) over all annotators, or None if there are none (cached until the next delta)."""
+        with self._lock:
+            if self._average is None:
+                models = list(self._state.get("models", {}).values())
+                if not models:
+                    return None
+                self._average = (sum(m["alpha"] for m in models) / len(models),
+                                 sum(m["beta"] for m in models) / len(models))
+            return self._average
+
+    # ------------------------------------------------------------------
+    def _run(self):
+        while True:
+            self._wake.wait(self.compact_interval)
+            self._wake.clear()
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"State snapshot failed: {e}")
+
+    def snapshot(self):
+        """Fold every worker's journaled deltas into a new snapshot (atomic rename), then empty the journal."""
+        with self._snapshot_lock, self._lock:
+            if self._pending == 0:
+                return False
+            # Exclusive: no worker appends between the read and the truncate
+            with self._flock.hold():
+                state, _ = self._read_disk()
+                atomic_write_json(self.path, state)
+                if os.path.exists(self.journal_path):
+                    os.truncate(self.journal_path, 0)
+                if os.path.exists(self.rotated_path):
+                    os.remove(self.rotated_path)
+            # The folded state also carries the other workers' annotators
+            self._state = state
+            self._average = None
+            self._pending = 0
+            self.snapshots += 1
+            return True
+
+    def close(self):
+        self.snapshot()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
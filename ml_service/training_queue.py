@@ -0,0 +1,112 @@
+"""
+Background training queue for CALLogBackend.fit.
+Webhooks only enqueue parsed annotations; a single trainer thread coalesces whatever
+is pending into micro-batches and hands each batch to one training call.
+A batch closes when it reaches `max_batch` items or `max_latency` seconds after its
+first item arrived, whichever comes first.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingQueue:
+    """
+    Usage:
+        queue = TrainingQueue(train_batch, max_batch=64, max_latency=0.5)
+        queue.submit(job)      # returns immediately
+        queue.join(timeout=5)  # optional: wait until everything submitted so far is trained
+    """
+
+    def __init__(self, train_fn, max_batch=64, max_latency=0.5, name="cal-log-trainer"):
+        self.train_fn = train_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_latency = float(max_latency)
+        self.name = name
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._done = 0
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            # (Re)start after a fork: the parent's trainer thread does not exist here
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, job):
+        """Enqueue one job. Returns the queue depth after the insert."""
+        with self._cond:
+            self._pending.append(job)
+            self._submitted += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+            return len(self._pending)
+
+    def depth(self):
+        return len(self._pending)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give concurrent webhooks a short window to join this batch
+            deadline = time.monotonic() + self.max_latency
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                self.train_fn(batch)
+            except Exception as e:
+                self.failures += 1
+                logger.exception(f"❌ Training batch of {len(batch)} failed: {e}")
+            self.last_batch_size = len(batch)
+            self.last_batch_seconds = time.perf_counter() - start
+            self.batches += 1
+            with self._cond:
+                self._done += len(batch)
+                self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Block until every job submitted before this call has been trained. Returns True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            if self._done < target:
+                self._ensure_thread()
+            while self._done < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        return {
+            "depth": len(self._pending),
+            "submitted": self._submitted,
+            "trained": self._done,
+            "batches": self.batches,
+            "failures": self.failures,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": self.last_batch_seconds,
+        }
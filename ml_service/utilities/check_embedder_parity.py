@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from embedders import load_embedder
+
+SAMPLE_TEXTS = [
+    "The stock market reached new highs today",
+    "Scientists discover new species in Amazon",
+    "Lakers win championship game",
+    "Apple announces new iPhone model",
+    "Oil prices fall as OPEC agrees to raise output after a week of tense negotiations in Vienna",
+    "",
+    "Short",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX embedder parity against the torch engine")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Sentence-transformers model name")
+    parser.add_argument("--engines", nargs="+", default=["onnx", "onnx-int8"], help="Engines to compare")
+    parser.add_argument("--tolerance", type=float, default=0.98, help="Minimum cosine similarity per text")
+    args = parser.parse_args()
+
+    reference = load_embedder("torch", args.model).encode(SAMPLE_TEXTS)
+
+    failed = False
+    for engine in args.engines:
+        candidate = load_embedder(engine, args.model).encode(SAMPLE_TEXTS)
+        # Both engines return L2-normalized vectors, so the row-wise dot product is the cosine
+        cosine = np.sum(reference * candidate, axis=1)
+        worst = float(cosine.min())
+        status = "✅" if worst >= args.tolerance else "❌"
+        print(f"{status} {engine}: min cosine {worst:.4f}, mean {float(cosine.mean()):.4f} (tolerance {args.tolerance})")
+        failed = failed or worst < args.tolerance
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
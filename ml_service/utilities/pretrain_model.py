@@ -8,6 +8,7 @@ def main():
     parser.add_argument("--dataset", default="ag_news", help="HuggingFace dataset name")
     parser.add_argument("--samples", type=int, default=500, help="Number of samples to train on")
     parser.add_argument("--output", default="pretrained_backbone.pkl", help="Output filename")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Embedding worker processes")
     args = parser.parse_args()
 
     print(f"🚀 Starting Pre-training on {args.dataset} ({args.samples} samples)...")
@@ -23,7 +24,8 @@ def main():
         return
 
     # Train
-    bb = StandardBackbone(num_labels=4) # Defaulting to 4 for AG News
+    # Large datasets are embedded across a process pool (smaller ones stay in-process)
+    bb = StandardBackbone(num_labels=4, pool_workers=args.workers) # Defaulting to 4 for AG News
     bb.fine_tune(texts, labels, epochs=3)
     
     # Save
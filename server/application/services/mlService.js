@@ -8,7 +8,27 @@ class MLService {
   async getEmbeddings(texts) {
     try {
       const res = await axios.post(`${this.baseUrl}/embed`, { texts });
-      return res.data;
+      return res.data.embeddings;
+    } catch (err) {
+      console.error("ML Service Error:", err.message);
+      return [];
+    }
+  }
+
+  // Bulk variant: raw little-endian float32 rows instead of decimal JSON.
+  // Body layout: 16-byte header ("EMBD", version, dtype, reserved, rows, dim), then the values.
+  async getEmbeddingsBinary(texts) {
+    try {
+      const res = await axios.post(
+        `${this.baseUrl}/embed`,
+        { texts, format: "binary", dtype: "float32" },
+        { responseType: "arraybuffer" }
+      );
+      const buf = Buffer.from(res.data);
+      const rows = buf.readUInt32LE(8);
+      const dim = buf.readUInt32LE(12);
+      const values = new Float32Array(buf.buffer.slice(buf.byteOffset + 16, buf.byteOffset + 16 + rows * dim * 4));
+      return Array.from({ length: rows }, (_, i) => values.subarray(i * dim, (i + 1) * dim));
     } catch (err) {
       console.error("ML Service Error:", err.message);
       return [];